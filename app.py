@@ -1,18 +1,39 @@
 # app.py
 from __future__ import annotations
+import asyncio
+import copy
+import functools
+import gzip
+import hashlib
+import hmac
 import io
 import json
+import os
 import time
-import zipfile
 import re
-from typing import Dict, Any, List, Tuple
-
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Iterator, List, Tuple
+
+import orjson
 import pandas as pd
 import streamlit as st
 
-from src.rubric_schema import load_rubric_json, load_rubric_excel
+try:
+    import xxhash
+except ImportError:  # optional; blake2b is the fallback for cache keys
+    xxhash = None
+
+from src.rubric_schema import effective_points, load_rubric_json, load_rubric_excel
 from src.segmentor import split_sections
-from src.notebook_exec import run_ipynb_bytes
+from src.notebook_exec import export_html, run_ipynb_job, warm_worker
+from src.package_manager import installed_versions
+from src.report_generator import render_student_report
+from src.store import ExecutionStore
+from src.llm_grader import BATCH_MAX_SECTIONS, build_section_context, grade_sections_batch_async
 
 # =========================
 # Page & Auth
@@ -22,6 +43,11 @@ st.set_page_config(layout="wide", page_title="Analytics Autograder")
 SESSION_KEY = "auth"
 SESSION_TTL = 60 * 60  # 60 minutes
 
+@st.cache_resource(show_spinner=False)
+def _users() -> Dict[str, str]:
+    """Configured logins, read from secrets once per process rather than on every rerun."""
+    return {str(u): str(p) for u, p in st.secrets.get("users", {}).items()}
+
 def require_login():
     auth = st.session_state.get(SESSION_KEY)
     now = time.time()
@@ -29,24 +55,54 @@ def require_login():
         st.session_state[SESSION_KEY]["ts"] = now
         return
     st.title("🔐 Login")
-    users = st.secrets.get("users", {})
+    users = _users()
     if not users:
         st.warning("No users configured. Add a [users] block in Streamlit Secrets.")
     with st.form("login"):
         u = st.text_input("Username")
         p = st.text_input("Password", type="password")
         ok = st.form_submit_button("Sign in")
-    if ok and u in users and p == str(users[u]):
+    stored = users.get(u) if ok else None
+    # constant-time compare, so response timing doesn't leak how much of a password matched
+    if stored is not None and hmac.compare_digest(stored.encode("utf-8"), p.encode("utf-8")):
         st.session_state[SESSION_KEY] = {"user": u, "ts": time.time()}
         st.success(f"Welcome, {u}!")
         st.rerun()
     st.stop()
 
+def _remove_uploads(buf: Dict[str, str]) -> None:
+    for path in buf.values():
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def _close_openai(loop: asyncio.AbstractEventLoop, http) -> None:
+    """Close a session's httpx pool on the loop that opened it, then the loop itself."""
+    if loop.is_closed() or loop.is_running():
+        return
+    try:
+        loop.run_until_complete(http.aclose())
+    except Exception:
+        pass
+    finally:
+        loop.close()
+
 require_login()
 with st.sidebar:
     st.caption("Session")
     if st.button("Log out"):
-        st.session_state.pop(SESSION_KEY, None)
+        # drop this session's executed notebooks and uploaded submissions from disk
+        if "store" in st.session_state:
+            st.session_state.pop("store").close()
+        _remove_uploads(st.session_state.pop("files_buf", {}))
+        # and its OpenAI connections and event loop
+        st.session_state.pop("_openai", None)
+        close_openai = st.session_state.pop("_openai_close", None)
+        if close_openai is not None:
+            close_openai()
+        for k in ("_subs_upload_key", "_subs_loaded", SESSION_KEY):
+            st.session_state.pop(k, None)
         st.rerun()
 
 st.title("📊 Analytics Notebook Autograder")
@@ -54,6 +110,8 @@ st.title("📊 Analytics Notebook Autograder")
 # Clear old cached list structure once (migrated to dict)
 if isinstance(st.session_state.get("llm_results"), list):
     st.session_state.pop("llm_results")
+# Executions moved from session state to the on-disk ExecutionStore
+st.session_state.pop("executions", None)
 
 # =========================
 # Session state helpers
@@ -64,53 +122,475 @@ def ss_get(key, default):
     return st.session_state[key]
 
 rubric: Dict[str, Any] = ss_get("rubric", {})
-files_buf: Dict[str, bytes] = ss_get("files_buf", {})
+files_buf: Dict[str, str] = ss_get("files_buf", {})               # filename -> temp file path
 roster_df: pd.DataFrame | None = ss_get("roster_df", None)
 mapping_df: pd.DataFrame = ss_get("mapping_df", pd.DataFrame(columns=["filename","student_id","student_name"]))
-executions: Dict[str, Dict[str, Any]] = ss_get("executions", {})  # student_id -> exec info
+if "store" not in st.session_state:
+    st.session_state["store"] = ExecutionStore(tempfile.mkdtemp(prefix="autograder_"))
+    # uploads live as long as the session's store; both go when the session is dropped
+    weakref.finalize(st.session_state["store"], _remove_uploads, files_buf)
+store: ExecutionStore = st.session_state["store"]               # executed notebooks/HTML live on disk
+executions: Dict[str, Dict[str, Any]] = store.meta                # student_id -> exec metadata
 llm_results: Dict[str, Dict[str, Any]] = ss_get("llm_results", {})# student_id -> graded
-overrides: Dict[str, float] = ss_get("overrides", {})             # f"{sid}::{Qid}" -> score
+overrides: Dict[Tuple[str,str], float] = ss_get("overrides", {})  # (sid, Qid) -> score
+if overrides and isinstance(next(iter(overrides)), str):
+    # migrate the older f"{sid}::{Qid}" string keys
+    overrides = {tuple(k.split("::", 1)): v for k, v in overrides.items()}
+    st.session_state["overrides"] = overrides
+results_rev: int = ss_get("results_rev", 0)                        # bumped whenever llm_results is rebuilt
 
 # =========================
 # Utilities
 # =========================
+# Patterns are ASCII-only and already spell out [A-Za-z]; only the extension needs case folding.
+# Order matters: the last pattern is a catch-all.
 _FILENAME_STUDENT_PATTERNS = [
-    r"^(?P<last>[^,_-]+),\s*(?P<first>[^_-]+)\s*-\s*(?P<id>[A-Za-z0-9._-]+).*\.ipynb$",
-    r"^(?P<id>\d+)[-_].*\.ipynb$",
-    r"^(?P<first>[A-Za-z]+)[-_](?P<last>[A-Za-z]+)[-_](?P<id>[A-Za-z0-9]+).*\.ipynb$",
-    r"^(?P<id>[A-Za-z0-9._-]+).*\.ipynb$",
+    r"^(?P<last>[^,_-]+),\s*(?P<first>[^_-]+)\s*-\s*(?P<id>[A-Za-z0-9._-]+).*(?i:\.ipynb)$",
+    r"^(?P<id>\d+)[-_].*(?i:\.ipynb)$",
+    r"^(?P<first>[A-Za-z]+)[-_](?P<last>[A-Za-z]+)[-_](?P<id>[A-Za-z0-9]+).*(?i:\.ipynb)$",
+    r"^(?P<id>[A-Za-z0-9._-]+).*(?i:\.ipynb)$",
 ]
+_FILENAME_STUDENT_RES = tuple(re.compile(p) for p in _FILENAME_STUDENT_PATTERNS)
+
+def guess_students_from_filenames(names: pd.Series) -> pd.DataFrame:
+    """Guess student_id/student_name per filename: one str.extract per pattern over the still-unmatched names."""
+    out = pd.DataFrame({"student_id": names, "student_name": names}, index=names.index)
+    todo = names
+    for rx in _FILENAME_STUDENT_RES:
+        if todo.empty:
+            break
+        m = todo.str.extract(rx)
+        hit = m.notna().any(axis=1)
+        m = m[hit]
+
+        def part(g: str) -> pd.Series:
+            return m[g].str.strip() if g in m else pd.Series("", index=m.index)
+
+        gid = part("id")
+        sname = (part("first").str.title() + " " + part("last").str.title()).str.strip()
+        sname = sname.mask(sname.eq(""), gid)
+        out.loc[m.index, "student_id"] = gid.mask(gid.eq(""), sname)
+        out.loc[m.index, "student_name"] = sname
+        todo = todo[~hit]
+    base = todo.str.rsplit("/", n=1).str[-1].str.replace(".ipynb", "", regex=False)
+    out.loc[todo.index, "student_id"] = base
+    out.loc[todo.index, "student_name"] = base
+    return out
 
-def guess_student_from_filename(name: str) -> Tuple[str,str]:
-    for pat in _FILENAME_STUDENT_PATTERNS:
-        m = re.match(pat, name, flags=re.IGNORECASE)
-        if m:
-            gid = (m.groupdict().get("id") or "").strip()
-            first = (m.groupdict().get("first") or "").strip().title()
-            last  = (m.groupdict().get("last") or "").strip().title()
-            sname = " ".join(x for x in [first, last] if x).strip() or gid
-            gid = gid or sname
-            return (gid, sname)
-    base = name.rsplit("/",1)[-1]
-    base = base.replace(".ipynb","")
-    return (base, base)
-
-def collect_ipynbs(upload) -> List[tuple[str, bytes]]:
+def _spool(src) -> str:
+    """Copy a notebook stream to a temp file in 1 MiB chunks and return its path."""
+    with tempfile.NamedTemporaryFile("wb", suffix=".ipynb", prefix="upload_", delete=False) as f:
+        shutil.copyfileobj(src, f, 1 << 20)
+    return f.name
+
+def collect_ipynbs(upload, on_progress=None) -> Iterator[tuple[str, str]]:
+    """
+    Yield (filename, temp path) per notebook without buffering the whole upload.
+    `on_progress(done, total)` is called after each notebook.
+    """
+    upload.seek(0)
     if upload.name.lower().endswith(".ipynb"):
-        return [(upload.name.split("/")[-1], upload.getvalue())]
-    out = []
-    with zipfile.ZipFile(io.BytesIO(upload.getvalue())) as z:
-        for nm in z.namelist():
-            if nm.lower().endswith(".ipynb") and not nm.endswith("/"):
-                out.append((nm.split("/")[-1], z.read(nm)))
+        yield upload.name.split("/")[-1], _spool(upload)
+        return
+    # UploadedFile is already file-like; ZipFile reads entries straight from it
+    import zipfile  # only needed for ZIP uploads
+    with zipfile.ZipFile(upload) as z:
+        # the central directory gives the count up front, before anything is decompressed
+        infos = [i for i in z.infolist() if i.filename.lower().endswith(".ipynb") and not i.is_dir()]
+        for done, info in enumerate(infos, start=1):
+            with z.open(info) as src:
+                yield info.filename.rsplit("/", 1)[-1], _spool(src)
+            if on_progress:
+                on_progress(done, len(infos))
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def _new_upload(slot: str, upload) -> bool:
+    """True the first time this uploaded file is seen in `slot`; uploaders re-deliver it on every rerun."""
+    key = getattr(upload, "file_id", None) or (upload.name, upload.size)
+    if st.session_state.get(slot) == key:
+        return False
+    st.session_state[slot] = key
+    return True
+
+@st.cache_data(show_spinner=False)
+def _parse_rubric(name: str, blob: bytes) -> dict:
+    return load_rubric_json(io.BytesIO(blob)) if name.endswith(".json") else load_rubric_excel(io.BytesIO(blob))
+
+@st.cache_data(show_spinner=False)
+def _parse_roster(blob: bytes) -> pd.DataFrame:
+    return pd.read_csv(io.BytesIO(blob))
+
+def _progress_ticker(bar, total: int, min_interval: float = 0.2):
+    """Return tick(done) that redraws `bar` every ~1% of `total` or 200 ms, and always at the end."""
+    step = max(1, total // 100)
+    last = [time.monotonic(), 0]  # time and count of the last redraw
+    def tick(done: int):
+        # `done` may jump by more than one (duplicate notebooks finish together), so
+        # compare against the last drawn count rather than testing multiples of `step`
+        now = time.monotonic()
+        if done == total or done - last[1] >= step or now - last[0] > min_interval:
+            bar.progress(done / total)
+            last[:] = [now, done]
+    return tick
+
+def _hexdigest(buf) -> str:
+    # Cache keys only, never integrity checks: xxh3 hashes multi-MB uploads far faster than blake2b
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(buf)
+    return hashlib.blake2b(buf, digest_size=16).hexdigest()
+
+def _digest(b: bytes | None) -> str | None:
+    return _hexdigest(b) if b else None
+
+@st.cache_resource(show_spinner=False)
+def _exec_pool() -> ProcessPoolExecutor:
+    """One worker pool for the server's lifetime, so each Run doesn't pay worker start-up again."""
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, initializer=warm_worker)
+
+# Outcomes that depend on the server, not the notebook: a package that failed to auto-install,
+# a cell that only timed out under load. The cache key can't see either, so they aren't stored.
+_UNCACHED_ERRORS = frozenset({"ModuleNotFoundError", "CellTimeoutError"})
+
+class _Uncacheable(Exception):
+    """Carries a run result out of `_cached_run` without cache_data storing it."""
+    def __init__(self, res: Dict[str, Any]):
+        super().__init__("result not cached")
+        self.res = res
+
+# Executed notebooks hold student work and outputs, so runs are cached in memory only unless
+# AUTOGRADER_PERSIST_RUNS=1 opts in to Streamlit's on-disk cache (kept across restarts and sessions).
+_PERSIST_RUNS = os.environ.get("AUTOGRADER_PERSIST_RUNS", "") == "1"
+
+@st.cache_data(persist="disk" if _PERSIST_RUNS else None, show_spinner=False, max_entries=500)
+def _cached_run(_pool: ProcessPoolExecutor, nb_hash: str, _nb_bytes: bytes, timeout: int,
+                data_zip_hash: str | None, _data_zip_path: str | None,
+                req_hash: str | None, _req_bytes: bytes | None,
+                retry: bool, skip_tags: tuple, env_sig: str, _executed: set) -> Dict[str, Any]:
+    """
+    Execute on the process pool; keyed on content hashes so identical inputs skip the kernel,
+    and on `env_sig` (installed package versions) so an upgrade doesn't replay older runs.
+    The body only runs on a miss, so `_executed` collects the hashes that really ran.
+    """
+    _executed.add(nb_hash)
+    try:
+        res = _pool.submit(run_ipynb_job, _nb_bytes, timeout, _data_zip_path, _req_bytes, retry, list(skip_tags)).result()
+    except BrokenProcessPool:
+        _exec_pool.clear()  # a dead worker poisons the pool; the next Run gets a fresh one
+        raise
+    if any(e.get("ename") in _UNCACHED_ERRORS for e in res["errors"]):
+        raise _Uncacheable(res)  # cache_data doesn't store a call that raised
+    return res
+
+def _run_job(*args) -> Dict[str, Any]:
+    """`_cached_run`, with results it refused to cache still handed back to the caller."""
+    try:
+        return _cached_run(*args)
+    except _Uncacheable as u:
+        return u.res
+
+def results_long_df() -> pd.DataFrame:
+    """
+    One row per (student, section) from llm_results, memoized in session state
+    until the next grading run bumps `results_rev`.
+    """
+    memo = st.session_state.get("_long_df")
+    if memo is not None and memo[0] == results_rev:
+        return memo[1]
+    cols = {k: [] for k in ("student_id","student_name","section_id","earned","max")}
+    for sid, res in llm_results.items():
+        for sec in res["sections"]:
+            cols["student_id"].append(sid)
+            cols["student_name"].append(res["student_name"])
+            cols["section_id"].append(sec.get("section_id", "Unknown"))
+            cols["earned"].append(float(sec["earned_points"]))
+            cols["max"].append(float(sec["total_points"]))
+    long_df = pd.DataFrame(cols)
+    st.session_state["_long_df"] = (results_rev, long_df)
+    return long_df
+
+def with_overrides(long_df: pd.DataFrame, overrides: Dict[Tuple[str,str], float]) -> pd.DataFrame:
+    """Add a `score` column: the manual override where one exists, else the LLM score."""
+    out = long_df.copy()
+    out["score"] = out["earned"]
+    if overrides:
+        keys = pd.MultiIndex.from_arrays([out["student_id"], out["section_id"]])
+        ov = pd.Series(overrides, dtype=float).reindex(keys).to_numpy()
+        out["score"] = out["score"].where(pd.isna(ov), ov)
     return out
 
-def ensure_openai_client():
-    if "openai" not in st.secrets or "api_key" not in st.secrets["openai"]:
-        st.error("OpenAI key missing in secrets. Add [openai] api_key.")
-        st.stop()
-    from openai import OpenAI
-    return OpenAI(api_key=st.secrets["openai"]["api_key"]), st.secrets["openai"].get("model","gpt-4o-mini")
+_SIG_OPTS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def _sig(obj) -> str:
+    return _hexdigest(orjson.dumps(obj, default=str, option=_SIG_OPTS))
+
+def results_sig() -> str:
+    """Content signature of llm_results (cache_data is shared across sessions, so not results_rev)."""
+    memo = st.session_state.get("_results_sig")
+    if memo is not None and memo[0] == results_rev:
+        return memo[1]
+    sig = _sig(llm_results)
+    st.session_state["_results_sig"] = (results_rev, sig)
+    return sig
+
+def rubric_sig_of(rubric: dict) -> str:
+    """
+    Content signature of the session rubric, memoized on its identity so ordinary reruns
+    don't re-serialize it. In-place edits must drop `_rubric_sig` first.
+    """
+    memo = st.session_state.get("_rubric_sig")
+    if memo is not None and memo[0] is rubric:
+        return memo[1]
+    sig = _sig(rubric)
+    st.session_state["_rubric_sig"] = (rubric, sig)
+    return sig
+
+@st.cache_data(show_spinner=False)
+def _analytics(results_sig: str, overrides_sig: str, _long_df: pd.DataFrame,
+               _overrides: Dict[Tuple[str,str], float]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Per-section long table and summary; recomputed only when results or overrides change."""
+    df = with_overrides(_long_df, _overrides)[["student_id","student_name","section_id","score","max"]]
+    df = df.assign(section_id=df["section_id"].astype("category"))
+    # sections stay in rubric (first-seen) order; no sort or unobserved-category pass
+    agg = df.groupby("section_id", observed=True, sort=False, as_index=False).agg(
+        n=("score","count"),
+        mean=("score","mean"),
+        max=("max","first")
+    )
+    agg["pct_mean"] = (agg["mean"] / agg["max"]) * 100.0
+    return df, agg
+
+@st.cache_data(show_spinner=False)
+def _rubric_table(sig: str, _rubric: dict) -> pd.DataFrame:
+    """Editable per-section table for the Rubric tab, rebuilt only when the rubric changes."""
+    secs = _rubric["sections"]
+    return pd.DataFrame({
+        "section_id": [s["id"] for s in secs],
+        "title": [s.get("title","") for s in secs],
+        "points": [float(s.get("points",0) or 0.0) for s in secs],
+        "criteria_count": [len(s.get("criteria",[])) for s in secs],
+    })
+
+@st.cache_data(show_spinner=False)
+def _rubric_total(sig: str, _rubric: dict) -> float:
+    """Total effective points, summed once per rubric version rather than on every rerun."""
+    return sum(effective_points(s) for s in _rubric["sections"])
+
+@st.cache_data(show_spinner=False)
+def _rubric_bytes(sig: str, _rubric: dict) -> bytes:
+    return orjson.dumps(_rubric, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+
+_CRIT_COLS = ["section_id","criterion_id","label","score","max","why","tip"]
+_CRIT_DTYPES = {"section_id": "string", "criterion_id": "string", "label": "string",
+                "score": "float64", "max": "float64", "why": "string", "tip": "string"}
+
+@st.cache_data(show_spinner=False)
+def _criteria_df(sections_json: str) -> pd.DataFrame:
+    """All of one student's criteria in a single table (one Arrow payload instead of one per section)."""
+    rows = [(sec["section_id"], c["criterion_id"], c["label"], c["score"], c["max"], c["rationale"],
+             c.get("improvement_tip",""))
+            for sec in json.loads(sections_json) for c in sec["criteria"]]
+    return pd.DataFrame.from_records(rows, columns=_CRIT_COLS).astype(_CRIT_DTYPES, copy=False)
+
+@st.cache_data(show_spinner=False, max_entries=100)
+def _class_scores(results_sig: str, overrides_sig: str, _long_df: pd.DataFrame,
+                  _overrides: Dict[Tuple[str,str], float],
+                  _llm_results: Dict[str, Dict[str, Any]]) -> tuple[pd.DataFrame, bytes]:
+    """
+    Class score table and its gzipped CSV, keyed on the results/overrides content signatures
+    rather than the frame, so reruns skip the encode. In-memory only (no persist="disk"): the
+    table holds names and grades.
+    """
+    # All three per-student totals in one groupby pass over the (student, section) rows
+    totals = with_overrides(_long_df, _overrides).groupby("student_id", sort=False).agg(
+        score_llm=("earned","sum"),
+        score_override=("score","sum"),
+        score_max=("max","sum"),
+    )
+    csv_df = pd.DataFrame({
+        "student_id": list(_llm_results),
+        "student_name": [res["student_name"] for res in _llm_results.values()],
+        "filename": [res["filename"] for res in _llm_results.values()],
+    })
+    csv_df = csv_df.join(totals, on="student_id").fillna({c: 0.0 for c in totals.columns})
+    csv_df = csv_df.sort_values(["student_name","student_id"])
+    return csv_df, gzip.compress(csv_df.to_csv(index=False).encode("utf-8"), compresslevel=6)
+
+@st.cache_data(show_spinner=False)
+def _student_html(sid: str, res_json: str, overrides_json: str) -> bytes:
+    """Render one student's report; JSON-string args keep the cache key cheap to hash."""
+    return render_student_report(sid, json.loads(res_json), json.loads(overrides_json)).encode("utf-8")
+
+def _openai_client():
+    """
+    Pooled AsyncOpenAI client for this session, reused across grading runs so
+    requests keep their TCP/TLS connections. httpx pools are bound to the loop
+    that opened them, so the client is held together with its own event loop.
+    """
+    held = st.session_state.get("_openai")
+    if held is None:
+        if "openai" not in st.secrets or "api_key" not in st.secrets["openai"]:
+            st.error("OpenAI key missing in secrets. Add [openai] api_key.")
+            st.stop()
+        try:
+            # deferred: openai (and its httpx) are the slowest imports and only grading needs them
+            import httpx
+            from openai import AsyncOpenAI
+        except ImportError:  # the rest of the app still works
+            st.error("The `openai` package is not installed.")
+            st.stop()
+        http = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            timeout=60,
+        )
+        client = AsyncOpenAI(api_key=st.secrets["openai"]["api_key"], http_client=http)
+        loop = asyncio.new_event_loop()
+        held = (loop, client, st.secrets["openai"].get("model","gpt-4o-mini"))
+        st.session_state["_openai"] = held
+        # closed on Log out, or once the session (and with it the client) is gone
+        st.session_state["_openai_close"] = weakref.finalize(client, _close_openai, loop, http)
+    return held
+
+@st.cache_data(show_spinner=False, max_entries=5000)
+def _section_ctx(nb_hash: str, sec_id: str, span_json: str, _load_nb) -> Dict[str, Any]:
+    """Section context keyed on notebook content, so re-grading skips parsing unchanged notebooks."""
+    # No HTML: contexts don't ship it, and decompressing MBs of it per student would be wasted
+    return build_section_context(_load_nb(), json.loads(span_json))
+
+async def _grade_student(client, model: str, info: Dict[str, Any], rubric: Dict[str, Any],
+                         sem: asyncio.Semaphore, shared: Dict[Tuple[str, str], asyncio.Future]) -> Dict[str, Any]:
+    spans = info["sections"]
+    sid = info["student_id"]
+    load_nb = functools.cache(lambda: store.load_nb(sid))
+
+    async def _grade_batch(items: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        async with sem:
+            return await grade_sections_batch_async(client, model, rubric, items, temperature=0.0)
+
+    loop = asyncio.get_running_loop()
+    futs, items = [], []  # every section's result future; the (sec_id, ctx, future) items this student sends
+    for sec in rubric.get("sections", []):
+        sec_id = sec["id"]
+        if sec_id not in spans:
+            continue  # skip if this section wasn't detected
+        span = spans.get(sec_id, {})
+        # if it's a list of cell indices, wrap it into a dict
+        if isinstance(span, list):
+            span = {"cell_idxs": span}
+        span_json = json.dumps(span, sort_keys=True, default=str)
+        ctx = _section_ctx(info["nb_hash"], sec_id, span_json, load_nb)
+        # Identical work (e.g. untouched starter code) is graded once and shared across students;
+        # hashed as a list so text can't shift between markdown, code and outputs and still match
+        key = (sec_id, _hexdigest(orjson.dumps([ctx["markdown"], ctx["code"], ctx["outputs"]])))
+        fut = shared.get(key)
+        if fut is None:
+            fut = shared[key] = loop.create_future()
+            items.append((sec_id, ctx, fut))
+        futs.append(fut)
+
+    async def _send(batch) -> None:
+        try:
+            graded = await _grade_batch([(sec_id, ctx) for sec_id, ctx, _ in batch])
+        except Exception as e:
+            # surfaces through the section futures, for every student sharing this batch
+            for *_, fut in batch:
+                fut.set_exception(e)
+            return
+        for (*_, fut), r in zip(batch, graded):
+            fut.set_result(r)
+
+    # One request per batch of sections keeps the shared instructions/schema from being resent each time
+    batches = [items[i:i + BATCH_MAX_SECTIONS] for i in range(0, len(items), BATCH_MAX_SECTIONS)]
+    await asyncio.gather(*map(_send, batches))
+    per_sections = [copy.deepcopy(r) for r in await asyncio.gather(*futs)]
+    total_max = sum(s["total_points"] for s in per_sections)
+    total_earned = sum(s["earned_points"] for s in per_sections)
+    return {
+        "student_id": info["student_id"],
+        "student_name": info["student_name"],
+        "filename": info["filename"],
+        "sections": per_sections,
+        "total": {"max": total_max, "earned": total_earned},
+    }
+
+async def _grade_all(client, model: str, students: List[Dict[str, Any]], rubric: Dict[str, Any],
+                     on_student_done, concurrency: int = 20,
+                     shared: Dict[Tuple[str, str], asyncio.Future] | None = None) -> List[Dict[str, Any]]:
+    """
+    Grade every student's section batches concurrently, capped by a semaphore.
+    `shared` maps (section_id, context hash) to its result, one entry per LLM-graded section.
+    Returns one result per student, in order: the graded dict, or the exception that failed it.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    shared = {} if shared is None else shared
+    tasks = [asyncio.create_task(_grade_student(client, model, info, rubric, sem, shared)) for info in students]
+    for t in tasks:
+        t.add_done_callback(on_student_done)
+    # one student's failed request shouldn't discard everyone already graded
+    return list(await asyncio.gather(*tasks, return_exceptions=True))
+
+@st.fragment
+def _execution_preview():
+    """Run-tab preview; picking a student or toggling the render reruns only this block."""
+    sid = st.selectbox("Preview student", options=list(executions.keys()),
+                       format_func=lambda k: f"{executions[k]['student_name']} ({k})")
+    info = executions[sid]
+    cols = st.columns([1,2,2])
+    with cols[0]:
+        st.caption(f"⏱ {info['duration_s']:.1f}s")
+        st.success("No execution errors") if not info["errors"] else st.error(f"{len(info['errors'])} error(s)")
+        st.write("Sections detected:")
+        st.code(", ".join(info["sections"].get("_order", [])) or "—", language="text")
+    with cols[1]:
+        st.markdown("**Notebook preview**")
+        # The rendered notebook can be MBs; only ship it to the browser when asked for
+        if st.toggle("Show rendered notebook", key="run_preview_html"):
+            html = store.load_html(sid)
+            if html is None:
+                # workers skip the export; most notebooks are never previewed
+                html = export_html(store.load_nb(sid))
+                store.put_html(sid, html)
+            st.components.v1.html(html, height=500, scrolling=True)
+    with cols[2]:
+        st.markdown("**Raw section spans**")
+        st.json(info["sections"])
+
+@st.fragment
+def _grade_review():
+    """Grade-tab review; browsing students/sections reruns only this block, score edits rerun the app."""
+    sid = st.selectbox("Review student", options=list(llm_results.keys()),
+                       format_func=lambda k: f"{llm_results[k]['student_name']} ({k})", key="grade_review_sid")
+    res = llm_results[sid]
+    st.caption(f"Total (LLM): **{res['total']['earned']:.2f} / {res['total']['max']:.2f}**")
+
+    st.dataframe(_criteria_df(json.dumps(res["sections"], sort_keys=True, default=str)),
+                 hide_index=True, use_container_width=True)
+
+    # One detail view at a time instead of an expander per section
+    secs = {sec["section_id"]: sec for sec in res["sections"]}
+    sec_id = st.selectbox("Section detail", options=list(secs), key=f"grade_review_sec_{sid}",
+                          format_func=lambda k: f"{k} — {secs[k]['earned_points']:.2f} / {secs[k]['total_points']:.2f}")
+    if sec_id is not None:
+        sec = secs[sec_id]
+        key = (sid, sec_id)
+        st.markdown("**Overall comment**")
+        st.write(sec.get("overall_comment",""))
+        prev_val = float(overrides.get(key, sec["earned_points"]))
+        new_val = st.number_input(
+            f"Override score for {sec_id} (0–{sec['total_points']})",
+            min_value=0.0, max_value=float(sec["total_points"]),
+            value=prev_val, step=0.5, key=f"ov_{sid}::{sec_id}"
+        )
+        if float(new_val) != prev_val:
+            overrides[key] = float(new_val)
+            st.rerun()  # Reports/Analytics totals depend on overrides
+
+    tot_override = sum(float(overrides.get((sid, k), sec["earned_points"])) for k, sec in secs.items())
+    st.caption(
+        f"Total (with overrides): **{tot_override:.2f} / {res['total']['max']:.2f}**"
+    )
 
 # =========================
 # Tabs
@@ -124,9 +604,10 @@ with tab_rubric:
     st.subheader("Upload / Edit Rubric")
     st.caption("Upload Excel (sheets: Sections, Criteria) or JSON.")
     up = st.file_uploader("Rubric file", type=["xlsx","json"], key="rubric_file")
-    if up:
+    # Only a new file replaces the rubric; otherwise every rerun would undo "Apply changes"
+    if up and _new_upload("_rubric_upload_key", up):
         try:
-            data = load_rubric_json(up) if up.name.endswith(".json") else load_rubric_excel(up)
+            data = _parse_rubric(up.name, up.getvalue())
             st.session_state["rubric"] = data
             rubric = data
             st.success("Rubric loaded ✅")
@@ -134,31 +615,29 @@ with tab_rubric:
             st.error(f"Failed to load rubric: {e}")
 
     if rubric:
+        rubric_sig = rubric_sig_of(rubric)
         cols = st.columns([1,2,1])
         with cols[0]:
             st.metric("Sections", len(rubric["sections"]))
         with cols[2]:
-            total = sum(s.get("points",0) or sum(c.get("max",0) for c in s.get("criteria",[])) for s in rubric["sections"])
-            st.metric("Total Points", total)
-
-        editable = [{
-            "section_id": s["id"],
-            "title": s.get("title",""),
-            "points": float(s.get("points",0) or 0.0),
-            "criteria_count": len(s.get("criteria",[]))
-        } for s in rubric["sections"]]
-        edf = st.data_editor(pd.DataFrame(editable), hide_index=True, key="rubric_editor")
+            st.metric("Total Points", _rubric_total(rubric_sig, rubric))
+
+        edf = st.data_editor(_rubric_table(rubric_sig, rubric), hide_index=True, key="rubric_editor")
         if st.button("Apply changes to titles/points"):
-            by_id = {row["section_id"]: row for _, row in edf.iterrows()}
+            ids = edf["section_id"].to_numpy()
+            titles = dict(zip(ids, edf["title"].to_numpy()))
+            points = dict(zip(ids, edf["points"].to_numpy().astype(float)))
             for s in rubric["sections"]:
-                if s["id"] in by_id:
-                    s["title"]  = by_id[s["id"]]["title"]
-                    s["points"] = float(by_id[s["id"]]["points"])
+                if s["id"] in titles:
+                    s["title"]  = titles[s["id"]]
+                    s["points"] = float(points[s["id"]])
+            st.session_state.pop("_rubric_sig", None)  # edited in place; identity alone won't notice
+            rubric_sig = rubric_sig_of(rubric)
             st.success("Applied edits.")
 
         st.download_button(
             "⬇️ Download rubric (JSON snapshot)",
-            data=json.dumps(rubric, indent=2).encode("utf-8"),
+            data=_rubric_bytes(rubric_sig, rubric),
             file_name="rubric_snapshot.json",
             mime="application/json"
         )
@@ -168,16 +647,27 @@ with tab_subs:
     st.subheader("Upload student notebooks")
     up_nb = st.file_uploader("Notebook or ZIP", type=["ipynb","zip"], key="subs_file")
     if up_nb:
-        pairs = collect_ipynbs(up_nb)
-        for nm, b in pairs:
-            files_buf[nm] = b
-        st.success(f"Loaded {len(pairs)} notebook(s).")
+        # The uploader keeps its file across reruns; only unpack a new upload once
+        if _new_upload("_subs_upload_key", up_nb):
+            n_loaded = 0
+            bar = st.progress(0.0, text="Unpacking submissions…")
+            tickers = {}  # total -> coalescing ticker, made on the first callback
+            on_progress = lambda d, t: tickers.setdefault(t, _progress_ticker(bar, t))(d)
+            for nm, path in collect_ipynbs(up_nb, on_progress=on_progress):
+                old = files_buf.get(nm)
+                if old and os.path.exists(old):
+                    os.unlink(old)
+                files_buf[nm] = path
+                n_loaded += 1
+            bar.empty()
+            st.session_state["_subs_loaded"] = n_loaded
+        st.success(f"Loaded {st.session_state.get('_subs_loaded', 0)} notebook(s).")
 
     st.caption("Optional roster CSV with columns: student_id, student_name")
     up_roster = st.file_uploader("Roster CSV", type=["csv"], key="roster_csv")
-    if up_roster:
+    if up_roster and _new_upload("_roster_upload_key", up_roster):
         try:
-            df = pd.read_csv(up_roster)
+            df = _parse_roster(up_roster.getvalue())
             assert {"student_id","student_name"}.issubset(df.columns)
             st.session_state["roster_df"] = df.copy()
             roster_df = df
@@ -186,25 +676,22 @@ with tab_subs:
             st.error(f"Roster parse failed: {e}")
 
     if files_buf:
-        rows = []
-        for fn in sorted(files_buf.keys()):
-            sid, sname = guess_student_from_filename(fn)
-            rows.append({"filename": fn, "student_id": sid, "student_name": sname})
-        mdf = pd.DataFrame(rows)
+        fns = pd.Series(sorted(files_buf), name="filename", dtype=object)
+        mdf = pd.concat([fns, guess_students_from_filenames(fns)], axis=1)
 
         if roster_df is not None:
-            merged = mdf.merge(roster_df, on="student_id", how="left", suffixes=("","_roster"))
-            merged["student_name"] = merged["student_name_roster"].fillna(merged["student_name"])
-            merged = merged.drop(columns=[c for c in merged.columns if c.endswith("_roster")])
-            mdf = merged
+            # Lookup-style join: hash map on student_id instead of a full merge
+            names = roster_df.drop_duplicates("student_id").set_index("student_id")["student_name"]
+            mdf["student_name"] = mdf["student_id"].map(names).fillna(mdf["student_name"])
 
         st.markdown("#### Map files to students")
         mapping_df = st.data_editor(mdf, num_rows="dynamic", use_container_width=True, key="map_editor")
         st.session_state["mapping_df"] = mapping_df
 
-        dup_ids = mapping_df["student_id"][mapping_df["student_id"].duplicated(keep=False)]
-        if len(dup_ids) > 0:
-            st.warning(f"Duplicate student_id values: {sorted(set(dup_ids))}")
+        sizes = mapping_df.groupby("student_id", sort=False).size()
+        dups = sorted(sizes.index[sizes.gt(1)])
+        if dups:
+            st.warning(f"Duplicate student_id values: {dups}")
 
 # ---------- Run ----------
 with tab_run:
@@ -226,61 +713,100 @@ with tab_run:
         skip_tags = [s.strip() for s in skip_tags_str.split(",") if s.strip()]
 
         if st.button("▶️ Run all mapped notebooks", type="primary"):
-            data_zip_bytes = data_zip_file.getvalue() if data_zip_file else None
+            data_zip_buf = data_zip_file.getbuffer() if data_zip_file else None  # zero-copy view
             req_bytes = reqs_file.getvalue() if reqs_file else None
-            executions.clear()
             progress = st.progress(0.0)
             items = list(mapping_df.to_dict(orient="records"))
-            for i, row in enumerate(items, start=1):
-                fn = row["filename"]; sid = str(row["student_id"]); sname = row["student_name"]
-                raw = files_buf.get(fn)
-                if not raw:
-                    continue
+            jobs = [row for row in items if row["filename"] in files_buf]
+            # Biggest notebooks first: the longest kernels start early instead of trailing the batch
+            jobs.sort(key=lambda row: os.path.getsize(files_buf[row["filename"]]), reverse=True)
+            for sid in set(executions) - {str(row["student_id"]) for row in jobs}:
+                store.drop(sid)
+            if jobs:
+                # Kernels are independent per student: fan out across cores. Cache lookups
+                # block, so a thread per worker drives _cached_run and only misses hit the pool.
+                n_workers = min(os.cpu_count() or 1, len(jobs))
+                data_zip_hash = _digest(data_zip_buf)
+                # Workers get one shared path, not a pickled copy of the ZIP per job
+                data_zip_path = None
+                if data_zip_buf:
+                    with tempfile.NamedTemporaryFile("wb", suffix=".zip", prefix="data_", delete=False) as f:
+                        f.write(data_zip_buf)
+                    data_zip_path = f.name
+                req_hash = _digest(req_bytes)
+                env_sig = _sig(installed_versions())
+                rubric_sig = rubric_sig_of(rubric)
+                pool = _exec_pool()
+                tick = _progress_ticker(progress, len(jobs))
+                n_done = 0
+                failed = []
+                executed: set = set()
+                n_reused = 0
                 try:
-                    res = run_ipynb_bytes(
-                        raw,
-                        timeout_per_cell=int(cell_timeout),
-                        data_zip=data_zip_bytes,
-                        extra_requirements_txt=req_bytes,
-                        probes=None,
-                        retry_on_timeout=retry_timeout,
-                        skip_tags=skip_tags,
-                    )
-                except TypeError:
-                    # older executor fallback
-                    res = run_ipynb_bytes(raw, timeout_per_cell=int(cell_timeout))
-                    res.probe_results = {}
-
-                spans = split_sections(res.executed_nb, rubric=st.session_state.get("rubric"))
-                executions[sid] = {
-                    "student_id": sid,
-                    "student_name": sname,
-                    "filename": fn,
-                    "duration_s": res.duration_s,
-                    "errors": res.errors,
-                    "html": res.html,
-                    "sections": spans,
-                    "executed_nb": res.executed_nb,
-                }
-                progress.progress(i/len(items))
+                    with ThreadPoolExecutor(max_workers=n_workers) as ex:
+                        futs = {}    # future -> [(row, run_key, nb_hash), ...] sharing its result
+                        by_key = {}  # run_key -> future, so identical notebooks execute once per batch
+                        for row in jobs:
+                            sid = str(row["student_id"])
+                            raw = _read_bytes(files_buf[row["filename"]])
+                            nb_hash = _digest(raw)
+                            run_key = _sig([nb_hash, int(cell_timeout), data_zip_hash, req_hash,
+                                            retry_timeout, skip_tags, env_sig, rubric_sig])
+                            if executions.get(sid, {}).get("run_key") == run_key:
+                                # Same bytes, settings and rubric as the stored run: keep it as is
+                                store.update(sid, student_name=row["student_name"], filename=row["filename"])
+                                n_reused += 1
+                                n_done += 1
+                                tick(n_done)
+                                continue
+                            fut = by_key.get(run_key)
+                            if fut is None:
+                                fut = by_key[run_key] = ex.submit(
+                                    _run_job, pool, nb_hash, raw, int(cell_timeout),
+                                    data_zip_hash, data_zip_path, req_hash, req_bytes,
+                                    retry_timeout, tuple(skip_tags), env_sig, executed,
+                                )
+                                futs[fut] = []
+                            futs[fut].append((row, run_key, nb_hash))
+                        for fut in as_completed(futs):
+                            group = futs[fut]
+                            try:
+                                res = fut.result()
+                            except Exception as e:
+                                # One broken submission shouldn't sink the rest of the batch
+                                for row, _, _ in group:
+                                    failed.append(f"{row['filename']}: {type(e).__name__}: {e}")
+                                    store.drop(str(row["student_id"]))  # don't leave an older run standing in
+                                n_done += len(group)
+                                tick(n_done)
+                                continue
+                            # Only the first copy may have run a kernel; duplicates reuse its result
+                            n_reused += len(group) - (group[0][2] in executed)
+                            spans = split_sections(res["executed_nb"], rubric=st.session_state.get("rubric"))
+                            for row, run_key, _ in group:
+                                sid = str(row["student_id"])
+                                store.put(sid, {
+                                    "student_id": sid,
+                                    "student_name": row["student_name"],
+                                    "filename": row["filename"],
+                                    "duration_s": res["duration_s"],
+                                    "errors": res["errors"],
+                                    "sections": spans,
+                                    "run_key": run_key,
+                                }, res["executed_nb"])
+                            n_done += len(group)
+                            tick(n_done)
+                finally:
+                    if data_zip_path:
+                        os.remove(data_zip_path)
+                if failed:
+                    st.error("Could not execute:\n\n" + "\n\n".join(failed))
+                if n_reused:
+                    st.caption(f"cached ✓ — {n_reused} notebook(s) matched an earlier run or another upload and were not re-executed.")
             st.success(f"Executed {len(executions)} notebook(s).")
 
     if executions:
-        sid = st.selectbox("Preview student", options=list(executions.keys()),
-                           format_func=lambda k: f"{executions[k]['student_name']} ({k})")
-        info = executions[sid]
-        cols = st.columns([1,2,2])
-        with cols[0]:
-            st.caption(f"⏱ {info['duration_s']:.1f}s")
-            st.success("No execution errors") if not info["errors"] else st.error(f"{len(info['errors'])} error(s)")
-            st.write("Sections detected:")
-            st.code(", ".join(info["sections"].get("_order", [])) or "—", language="text")
-        with cols[1]:
-            st.markdown("**Notebook preview**")
-            st.components.v1.html(info["html"], height=500, scrolling=True)
-        with cols[2]:
-            st.markdown("**Raw section spans**")
-            st.json(info["sections"])
+        _execution_preview()
 
 # ---------- Grade ----------
 with tab_grade:
@@ -296,78 +822,37 @@ with tab_grade:
         grade_disabled = not OPENAI_OK
 
         if st.button("🤖 Grade all students (LLM)", type="primary", disabled=grade_disabled):
-            client, model = ensure_openai_client()
-            import importlib
-            llm_grader = importlib.import_module("src.llm_grader")
-            build_section_context = llm_grader.build_section_context
-            grade_section_llm   = llm_grader.grade_section_llm
-
             llm_results.clear()
             students = list(executions.values())
             progress = st.progress(0.0)
-            for i, info in enumerate(students, start=1):
-                spans = info["sections"]
-                nb = info["executed_nb"]; html = info["html"]
-                per_sections = []
-                for sec in rubric.get("sections", []):
-                    sec_id = sec["id"]
-                    if sec_id not in spans:
-                        continue  # skip if this section wasn't detected
-                    span = spans.get(sec_id, {})
-                    # if it's a list of cell indices, wrap it into a dict
-                    if isinstance(span, list):
-                        span = {"cell_idxs": span}
-
-                    ctx = build_section_context(nb, span, html)
-                    graded = grade_section_llm(client, model, rubric, sec_id, ctx, temperature=0.0)
-                    per_sections.append(graded)
-                total_max = sum(s["total_points"] for s in per_sections)
-                total_earned = sum(s["earned_points"] for s in per_sections)
-                sid = info["student_id"]
-                llm_results[sid] = {
-                    "student_id": sid,
-                    "student_name": info["student_name"],
-                    "filename": info["filename"],
-                    "sections": per_sections,
-                    "total": {"max": total_max, "earned": total_earned},
-                }
-                progress.progress(i/len(students))
+            tick = _progress_ticker(progress, len(students))
+            graded_count = [0]
+
+            def _on_student_done(_task):
+                graded_count[0] += 1
+                tick(graded_count[0])
+
+            loop, client, model = _openai_client()
+            concurrency = int(st.secrets["openai"].get("concurrency", 20))  # lower it for tight rate limits
+            unique: Dict[Tuple[str, str], asyncio.Future] = {}
+            graded = _grade_all(client, model, students, rubric, _on_student_done,
+                                concurrency=concurrency, shared=unique)
+            failed = []
+            for info, res in zip(students, loop.run_until_complete(graded)):
+                if isinstance(res, BaseException):
+                    failed.append(f"{info['student_name']} ({info['student_id']}): {type(res).__name__}: {res}")
+                else:
+                    llm_results[res["student_id"]] = res
+            if failed:
+                st.error("Could not grade:\n\n" + "\n\n".join(failed))
+            st.session_state["results_rev"] = results_rev = results_rev + 1
+            n_secs = sum(len(res["sections"]) for res in llm_results.values())
             st.success(f"Graded {len(llm_results)} student(s).")
+            if n_secs > len(unique):
+                st.sidebar.caption(f"Reused {n_secs - len(unique)} of {n_secs} section grade(s) from identical work.")
 
         if llm_results:
-            sid = st.selectbox("Review student", options=list(llm_results.keys()),
-                               format_func=lambda k: f"{llm_results[k]['student_name']} ({k})", key="grade_review_sid")
-            res = llm_results[sid]
-            st.caption(f"Total (LLM): **{res['total']['earned']:.2f} / {res['total']['max']:.2f}**")
-
-            tot_override = 0.0
-            for sec in res["sections"]:
-                with st.expander(f"{sec['section_id']} — {sec['earned_points']:.2f} / {sec['total_points']:.2f}", expanded=False):
-                    df = pd.DataFrame([{
-                        "criterion_id": c["criterion_id"],
-                        "label": c["label"],
-                        "score": c["score"],
-                        "max": c["max"],
-                        "why": c["rationale"],
-                        "tip": c.get("improvement_tip",""),
-                    } for c in sec["criteria"]])
-                    st.dataframe(df, hide_index=True, use_container_width=True)
-                    st.markdown("**Overall comment**")
-                    st.write(sec.get("overall_comment",""))
-
-                    key = f"{sid}::{sec['section_id']}"
-                    default_val = float(sec["earned_points"])
-                    new_val = st.number_input(
-                        f"Override score for {sec['section_id']} (0–{sec['total_points']})",
-                        min_value=0.0, max_value=float(sec["total_points"]),
-                        value=overrides.get(key, default_val), step=0.5, key=f"ov_{key}"
-                    )
-                    overrides[key] = float(new_val)
-                    tot_override += float(new_val)
-
-            st.caption(
-                f"Total (with overrides): **{tot_override:.2f} / {res['total']['max']:.2f}**"
-            )
+            _grade_review()
 
 # ---------- Reports ----------
 with tab_reports:
@@ -375,57 +860,28 @@ with tab_reports:
     if not llm_results:
         st.info("Grade students in the **Grade** tab first.")
     else:
-        rows = []
-        for sid, res in llm_results.items():
-            total_override = 0.0
-            for sec in res["sections"]:
-                key = f"{sid}::{sec['section_id']}"
-                total_override += float(overrides.get(key, sec["earned_points"]))
-            rows.append({
-                "student_id": sid,
-                "student_name": res["student_name"],
-                "filename": res["filename"],
-                "score_llm": res["total"]["earned"],
-                "score_override": total_override,
-                "score_max": res["total"]["max"],
-            })
-        csv_df = pd.DataFrame(rows).sort_values(["student_name","student_id"])
+        csv_df, csv_gz = _class_scores(results_sig(), _sig(sorted(overrides.items())),
+                                       results_long_df(), overrides, llm_results)
         st.dataframe(csv_df, use_container_width=True, hide_index=True)
         st.download_button(
-            "⬇️ Download class scores (CSV)",
-            data=csv_df.to_csv(index=False).encode("utf-8"),
-            file_name="class_scores.csv",
-            mime="text/csv"
+            "⬇️ Download class scores (CSV, gzip)",
+            data=csv_gz,
+            file_name="class_scores.csv.gz",
+            mime="application/gzip"
         )
 
         st.markdown("---")
         sid = st.selectbox("Generate report for student", options=list(llm_results.keys()),
                            format_func=lambda k: f"{llm_results[k]['student_name']} ({k})", key="report_sid")
         res = llm_results[sid]
-        html_parts = [
-            f"<h2>Report — {res['student_name']} ({sid})</h2>",
-            f"<p><b>File:</b> {res['filename']}</p>",
-            f"<p><b>Total (LLM):</b> {res['total']['earned']:.2f} / {res['total']['max']:.2f}</p>",
-        ]
-        total_override = 0.0
-        for sec in res["sections"]:
-            key = f"{sid}::{sec['section_id']}"
-            sec_score = overrides.get(key, sec["earned_points"])
-            total_override += float(sec_score)
-            html_parts.append(f"<h3>{sec['section_id']} — {sec_score:.2f}/{sec['total_points']:.2f}</h3>")
-            html_parts.append("<ul>")
-            for c in sec["criteria"]:
-                html_parts.append(
-                    f"<li><b>{c['label']}</b>: {c['score']:.2f}/{c['max']:.2f}<br/><i>{c['rationale']}</i></li>"
-                )
-            html_parts.append("</ul>")
-            if sec.get("overall_comment"):
-                html_parts.append(f"<p><b>Overall:</b> {sec['overall_comment']}</p>")
-        html_parts.append(f"<p><b>Total (with overrides):</b> {total_override:.2f} / {res['total']['max']:.2f}</p>")
-        html_report = "\n".join(html_parts)
+        sec_overrides = {
+            sec["section_id"]: overrides[(sid, sec["section_id"])]
+            for sec in res["sections"] if (sid, sec["section_id"]) in overrides
+        }
+        html_report = _student_html(sid, json.dumps(res, sort_keys=True), json.dumps(sec_overrides, sort_keys=True))
         st.download_button(
             "⬇️ Download student report (HTML)",
-            data=html_report.encode("utf-8"),
+            data=html_report,
             file_name=f"report_{sid}.html",
             mime="text/html"
         )
@@ -437,32 +893,13 @@ with tab_analytics:
     if not llm_results:
         st.info("Grade students in the **Grade** tab.")
     else:
-        rows = []
-        for sid, res in llm_results.items():
-            for sec in res["sections"]:
-                key = f"{sid}::{sec.get('section_id','?')}"
-                score = overrides.get(key, sec["earned_points"])
-                rows.append({
-                    "student_id": sid,
-                    "student_name": res["student_name"],
-                    "section_id": sec.get("section_id", "Unknown"),  # <- make sure this exists
-                    "score": float(score),
-                    "max": float(sec["total_points"]),
-                })
-        df = pd.DataFrame(rows)
-
-        if "section_id" not in df.columns:
+        df, agg = _analytics(results_sig(), _sig(sorted(overrides.items())), results_long_df(), overrides)
+
+        if df.empty:
             st.error("No section_id found in grading results — check rubric or LLM grader output.")
         else:
-            st.dataframe(df, width="stretch", hide_index=True)
-
-            agg = df.groupby("section_id").agg(
-                n=("score","count"),
-                mean=("score","mean"),
-                max=("max","first")
-            ).reset_index()
-            agg["pct_mean"] = (agg["mean"] / agg["max"]) * 100.0
+            st.dataframe(df, hide_index=True, use_container_width=True)
             st.markdown("#### Section summary")
-            st.dataframe(agg, width="stretch", hide_index=True)
+            st.dataframe(agg, hide_index=True, use_container_width=True)
             st.markdown("#### Mean % by section")
             st.bar_chart(agg.set_index("section_id")["pct_mean"])
\ No newline at end of file
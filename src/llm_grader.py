@@ -1,11 +1,22 @@
 # src/llm_grader.py
 from __future__ import annotations
-import json
 import hashlib
-from typing import Any, Dict, List
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List
 
 import nbformat
-from openai import OpenAI
+import orjson
+
+try:
+    import xxhash
+except ImportError:  # optional; sha256 is the fallback for context hashes
+    xxhash = None
+
+if TYPE_CHECKING:  # annotations only; the app owns the client import
+    from openai import AsyncOpenAI, OpenAI
 
 
 # ---------- helpers ----------
@@ -15,8 +26,26 @@ def _clip(s: str, max_chars: int) -> str:
         return ""
     return s if len(s) <= max_chars else (s[:max_chars] + " …[truncated]")
 
-def _sha16(s: str) -> str:
-    return hashlib.sha256((s or "").encode("utf-8")).hexdigest()[:16]
+def _bounded_append(parts: List[str], s: str, used: int, budget: int) -> int:
+    """
+    Append `s` to `parts` as if they'll be "\n\n"-joined and clipped to `budget`; returns the
+    joined length so far. Text past budget + 1 chars is never copied: one extra char is
+    enough for `_clip` to see that the bucket overflowed.
+    """
+    if used > budget:
+        return used
+    sep = 2 if parts else 0
+    room = budget - used - sep + 1
+    piece = s if len(s) <= room else s[:max(room, 0)]
+    parts.append(piece)
+    return used + sep + len(piece)
+
+def _hash16(s: str) -> str:
+    # Content address for dedup, not integrity: xxh3 is several times faster than sha256
+    buf = (s or "").encode("utf-8")
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(buf)
+    return hashlib.sha256(buf).hexdigest()[:16]
 
 def _rubric_slice(rubric: Dict[str, Any], section_id: str) -> Dict[str, Any]:
     for s in rubric.get("sections", []):
@@ -28,6 +57,8 @@ def _rubric_slice(rubric: Dict[str, Any], section_id: str) -> Dict[str, Any]:
 
 # ---------- public: context builder ----------
 
+_MD_CHARS, _CODE_CHARS, _OUT_CHARS = 4000, 4000, 6000  # per-bucket clip sizes
+
 def build_section_context(
     nb: nbformat.NotebookNode,
     span: Dict[str, Any],
@@ -44,37 +75,44 @@ def build_section_context(
     md_parts: List[str] = []
     code_parts: List[str] = []
     out_texts: List[str] = []
+    # joined length of each bucket so far; collection stops once a bucket passes its clip
+    md_used = code_used = out_used = 0
 
+    cells = nb.get("cells", [])
     cell_idxs = span.get("cell_idxs", [])
     for idx in cell_idxs:
-        if idx < 0 or idx >= len(nb.get("cells", [])):
+        if md_used > _MD_CHARS and code_used > _CODE_CHARS and out_used > _OUT_CHARS:
+            break
+        if idx < 0 or idx >= len(cells):
             continue
-        cell = nb["cells"][idx]
+        cell = cells[idx]
         ctype = cell.get("cell_type")
         if ctype == "markdown":
-            md_parts.append(cell.get("source", "") or "")
+            md_used = _bounded_append(md_parts, cell.get("source") or "", md_used, _MD_CHARS)
         elif ctype == "code":
-            code_parts.append(cell.get("source", "") or "")
+            code_used = _bounded_append(code_parts, cell.get("source") or "", code_used, _CODE_CHARS)
             for out in cell.get("outputs") or []:
+                if out_used > _OUT_CHARS:
+                    break
                 ot = out.get("output_type")
                 if ot == "stream":
-                    out_texts.append(out.get("text", "") or "")
+                    out_used = _bounded_append(out_texts, out.get("text") or "", out_used, _OUT_CHARS)
                 elif ot in ("display_data", "execute_result"):
                     data = out.get("data") or {}
                     txt = data.get("text/plain")
                     if isinstance(txt, list):
                         txt = "".join(txt)
                     if txt:
-                        out_texts.append(str(txt))
+                        out_used = _bounded_append(out_texts, str(txt), out_used, _OUT_CHARS)
 
-    md = _clip("\n\n".join(md_parts), 4000)
-    code = _clip("\n\n".join(code_parts), 4000)
-    outputs = _clip("\n\n".join(out_texts), 6000)
+    md = _clip("\n\n".join(md_parts), _MD_CHARS)
+    code = _clip("\n\n".join(code_parts), _CODE_CHARS)
+    outputs = _clip("\n\n".join(out_texts), _OUT_CHARS)
 
     return {
         "title": span.get("title", ""),
         "cell_range": [span.get("start", 0), span.get("end", 0)],
-        "hash": _sha16(md + code + outputs),
+        "hash": _hash16(md + code + outputs),
         "markdown": md,
         "code": code,
         "outputs": outputs,
@@ -112,30 +150,55 @@ JSON_SCHEMA = {
     "required": ["section_id", "criteria", "earned_points", "total_points"],
 }
 
-
-# ---------- public: LLM grading ----------
-
-def grade_section_llm(
-    client: OpenAI,
-    model: str,
+# Constant across calls: serialized once and spliced into each payload as a Fragment
+_SCHEMA_JSON = orjson.Fragment(orjson.dumps(JSON_SCHEMA))
+_BATCH_SCHEMA_JSON = orjson.Fragment(orjson.dumps({
+    "type": "object",
+    "properties": {"sections": {"type": "array", "items": JSON_SCHEMA}},
+    "required": ["sections"],
+}))
+
+_SYSTEM_MSG = (
+    "You are a strict teaching assistant for a university analytics course. "
+    "Grade ONLY the provided section of the student's notebook, according to the rubric. "
+    "Be precise and concise. Award partial credit where evidence supports it. "
+    "Never exceed any per-criterion max nor the section total. "
+    "Return ONLY valid JSON that conforms to the provided schema."
+)
+
+_INSTRUCTIONS = (
+    "For each criterion:\n"
+    "- Score 0..max_points, using partial credit when appropriate.\n"
+    "- Base scores strictly on evidence in the section (markdown/code/outputs).\n"
+    "- Provide a short rationale and, if helpful, an improvement tip."
+)
+
+_BATCH_INSTRUCTIONS = (
+    "For each section and each of its criteria:\n"
+    "- Score 0..max_points, using partial credit when appropriate.\n"
+    "- Base scores strictly on evidence in that section (markdown/code/outputs).\n"
+    "- Provide a short rationale and, if helpful, an improvement tip.\n"
+    "- Each section's rubric is listed under `rubrics` with the same section_id.\n"
+    "- Echo each section_id exactly as given."
+)
+
+_BATCH_SYSTEM_MSG = (
+    "You are a strict teaching assistant for a university analytics course. "
+    "Grade EACH provided section of the student's notebook independently, according to its rubric. "
+    "Be precise and concise. Award partial credit where evidence supports it. "
+    "Never exceed any per-criterion max nor a section's total. "
+    "Return ONLY valid JSON: an object whose \"sections\" array holds one result per "
+    "section, each conforming to the provided schema."
+)
+
+
+# ---------- prompt building / result cleaning ----------
+
+def _section_spec(
     rubric: Dict[str, Any],
     section_id: str,
-    section_ctx: Dict[str, Any],
-    temperature: float = 0.0,
-) -> Dict[str, Any]:
-    """
-    Grade a single section via LLM. Returns:
-      {
-        "section_id": str,
-        "rubric_title": str,
-        "total_points": float,
-        "earned_points": float,
-        "criteria": [
-            {"criterion_id","label","max","score","rationale","improvement_tip"}
-        ],
-        "overall_comment": str
-      }
-    """
+) -> tuple[Dict[str, Any], List[Dict[str, Any]], float]:
+    """Return (rubric section, normalized criteria, section max)."""
     rsec = _rubric_slice(rubric, section_id)
 
     # Normalize criteria: treat any type as LLM-gradeable
@@ -150,57 +213,73 @@ def grade_section_llm(
 
     # Total points: prefer section.points else sum of criteria max
     total_max = float(rsec.get("points", 0.0) or sum(c["max_points"] for c in raw_criteria))
+    return rsec, raw_criteria, total_max
 
-    system_msg = (
-        "You are a strict teaching assistant for a university analytics course. "
-        "Grade ONLY the provided section of the student's notebook, according to the rubric. "
-        "Be precise and concise. Award partial credit where evidence supports it. "
-        "Never exceed any per-criterion max nor the section total. "
-        "Return ONLY valid JSON that conforms to the provided schema."
-    )
 
-    user_payload = {
+def _prepare_request(
+    rubric: Dict[str, Any],
+    section_id: str,
+    section_ctx: Dict[str, Any],
+) -> tuple[Dict[str, Any], List[Dict[str, Any]], float, List[Dict[str, str]]]:
+    """Return (rubric section, normalized criteria, section max, chat messages)."""
+    rsec, raw_criteria, total_max = _section_spec(rubric, section_id)
+
+    # Most-stable content first (instructions, schema, then this section's rubric) and the
+    # student's work last, so the provider's prompt prefix cache covers everything but it
+    rubric_payload = {
+        "instructions": _INSTRUCTIONS,
+        "json_schema": _SCHEMA_JSON,
         "section_id": section_id,
         "rubric": {
             "title": rsec.get("title", ""),
             "total_points": total_max,
             "criteria": raw_criteria,
         },
-        "student_section": section_ctx,
-        "instructions": (
-            "For each criterion:\n"
-            "- Score 0..max_points, using partial credit when appropriate.\n"
-            "- Base scores strictly on evidence in the section (markdown/code/outputs).\n"
-            "- Provide a short rationale and, if helpful, an improvement tip."
-        ),
-        "json_schema": JSON_SCHEMA,
     }
 
-    # Call the model with JSON response enforced
-    resp = client.chat.completions.create(
-        model=model,
-        temperature=temperature,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": json.dumps(user_payload)},
-        ],
-    )
+    messages = [
+        {"role": "system", "content": _SYSTEM_MSG},
+        {"role": "user", "content": orjson.dumps(rubric_payload).decode("utf-8")},
+        {"role": "user", "content": orjson.dumps({"student_section": section_ctx}).decode("utf-8")},
+    ]
+    return rsec, raw_criteria, total_max, messages
 
-    raw = resp.choices[0].message.content or "{}"
+
+def _clean_response(
+    raw: str,
+    rsec: Dict[str, Any],
+    raw_criteria: List[Dict[str, Any]],
+    total_max: float,
+    section_id: str,
+) -> Dict[str, Any]:
+    """Parse the model's JSON and clamp scores to the rubric."""
     try:
-        parsed = json.loads(raw)
+        parsed = orjson.loads(raw)
     except Exception:
-        # Fallback: empty but well-formed
-        parsed = {
-            "section_id": section_id,
-            "rubric_title": rsec.get("title", ""),
-            "total_points": total_max,
-            "earned_points": 0.0,
-            "criteria": [],
-            "overall_comment": "Model returned invalid JSON.",
-        }
+        parsed = _empty_result(rsec, total_max, section_id, "Model returned invalid JSON.")
+    return _clean_parsed(parsed, rsec, raw_criteria, total_max, section_id)
 
+
+def _empty_result(rsec: Dict[str, Any], total_max: float, section_id: str, comment: str) -> Dict[str, Any]:
+    # Fallback: empty but well-formed
+    return {
+        "section_id": section_id,
+        "rubric_title": rsec.get("title", ""),
+        "total_points": total_max,
+        "earned_points": 0.0,
+        "criteria": [],
+        "overall_comment": comment,
+    }
+
+
+def _clean_parsed(
+    parsed: Dict[str, Any],
+    rsec: Dict[str, Any],
+    raw_criteria: List[Dict[str, Any]],
+    total_max: float,
+    section_id: str,
+) -> Dict[str, Any]:
+    """Clamp one parsed section result to the rubric."""
     # Sanitize & clamp outputs
     cleaned_criteria: List[Dict[str, Any]] = []
     earned_sum = 0.0
@@ -238,4 +317,260 @@ def grade_section_llm(
         "earned_points": float(earned_sum),
         "criteria": cleaned_criteria,
         "overall_comment": str(parsed.get("overall_comment", "")),
-    }
\ No newline at end of file
+    }
+
+
+BATCH_MAX_SECTIONS = 4  # larger batches trade grading accuracy for fewer prompt tokens
+
+
+def _prepare_batch_request(
+    rubric: Dict[str, Any],
+    items: List[tuple[str, Dict[str, Any]]],
+) -> tuple[List[tuple[Dict[str, Any], List[Dict[str, Any]], float]], List[Dict[str, str]]]:
+    """Return (per-item section specs, chat messages) for one multi-section request."""
+    specs = [_section_spec(rubric, sec_id) for sec_id, _ in items]
+
+    # Same layout as `_prepare_request`: stable instructions/schema, then rubrics, then work
+    rubric_payload = {
+        "instructions": _BATCH_INSTRUCTIONS,
+        "json_schema": _BATCH_SCHEMA_JSON,
+        "rubrics": [
+            {
+                "section_id": sec_id,
+                "rubric": {
+                    "title": rsec.get("title", ""),
+                    "total_points": total_max,
+                    "criteria": raw_criteria,
+                },
+            }
+            for (sec_id, _), (rsec, raw_criteria, total_max) in zip(items, specs)
+        ],
+    }
+    work_payload = {
+        "sections": [{"section_id": sec_id, "student_section": ctx} for sec_id, ctx in items],
+    }
+
+    messages = [
+        {"role": "system", "content": _BATCH_SYSTEM_MSG},
+        {"role": "user", "content": orjson.dumps(rubric_payload).decode("utf-8")},
+        {"role": "user", "content": orjson.dumps(work_payload).decode("utf-8")},
+    ]
+    return specs, messages
+
+
+def _clean_batch_response(
+    raw: str,
+    items: List[tuple[str, Dict[str, Any]]],
+    specs: List[tuple[Dict[str, Any], List[Dict[str, Any]], float]],
+) -> List[Dict[str, Any]]:
+    """Split the model's `sections` array back into per-section results, in request order."""
+    try:
+        returned = orjson.loads(raw).get("sections") or []
+    except Exception:
+        returned = None
+    by_id = {
+        str(r.get("section_id")): r for r in (returned if isinstance(returned, list) else [])
+        if isinstance(r, dict)
+    }
+
+    out: List[Dict[str, Any]] = []
+    for (sec_id, _), (rsec, raw_criteria, total_max) in zip(items, specs):
+        parsed = by_id.get(sec_id)
+        if parsed is None:
+            comment = "Model returned invalid JSON." if returned is None else "Model omitted this section."
+            parsed = _empty_result(rsec, total_max, sec_id, comment)
+        out.append(_clean_parsed(parsed, rsec, raw_criteria, total_max, sec_id))
+    return out
+
+
+# ---------- response cache ----------
+# Content-addressed: the key covers model, temperature and the full messages, so a regrade
+# only calls the model for sections whose context or rubric changed. Replies quote student
+# work, so by default the cache lives in this process's memory and dies with it. Set
+# AUTOGRADER_LLM_CACHE to a file path to opt in to an on-disk cache shared by every session
+# on the server (kept _CACHE_TTL), or to "" to disable caching altogether.
+
+_CACHE_PATH = os.environ.get("AUTOGRADER_LLM_CACHE", ":memory:")
+_CACHE_TTL = 30 * 86400
+_PRUNE_EVERY = 3600  # expired rows are deleted by _cache_put at most this often per process
+_cache_lock = threading.Lock()
+_cache_db: sqlite3.Connection | None = None
+_last_prune = 0.0
+
+
+def _cache() -> sqlite3.Connection | None:
+    global _cache_db, _CACHE_PATH
+    if _cache_db is None and _CACHE_PATH:
+        try:
+            if _CACHE_PATH != ":memory:":
+                os.makedirs(os.path.dirname(_CACHE_PATH) or ".", exist_ok=True)
+            db = sqlite3.connect(_CACHE_PATH, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, raw TEXT NOT NULL, ts REAL NOT NULL)")
+            _cache_db = db
+        except (OSError, sqlite3.Error):
+            _CACHE_PATH = ""  # e.g. a read-only home dir: grade uncached rather than fail
+    return _cache_db
+
+
+def _response_key(model: str, temperature: float, messages: List[Dict[str, str]]) -> str:
+    return hashlib.sha256(orjson.dumps([model, temperature, messages], option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _cache_get(key: str) -> str | None:
+    db = _cache()
+    if db is None:
+        return None
+    with _cache_lock:
+        row = db.execute("SELECT raw, ts FROM responses WHERE key = ?", (key,)).fetchone()
+    return row[0] if row and time.time() - row[1] < _CACHE_TTL else None
+
+
+def _cache_put(key: str, raw: str | None, section_ids: List[str] | None = None) -> None:
+    """
+    Store a reply worth replaying: non-empty JSON and, for a batch, a result for every one of
+    `section_ids`. Anything else (no content, malformed, omitted sections) is asked again.
+    """
+    global _last_prune
+    db = _cache()
+    if db is None or not raw:
+        return
+    try:
+        parsed = orjson.loads(raw)
+    except Exception:
+        return
+    if not isinstance(parsed, dict) or not parsed:
+        return
+    if section_ids is not None:
+        returned = parsed.get("sections")
+        got = {str(r.get("section_id")) for r in returned if isinstance(r, dict)} if isinstance(returned, list) else set()
+        if not got.issuperset(map(str, section_ids)):
+            return
+    now = time.time()
+    with _cache_lock:
+        db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, raw, now))
+        if now - _last_prune > _PRUNE_EVERY:
+            _last_prune = now
+            db.execute("DELETE FROM responses WHERE ts < ?", (now - _CACHE_TTL,))
+
+
+def _complete(client: OpenAI, model: str, temperature: float, messages: List[Dict[str, str]],
+              section_ids: List[str] | None = None) -> str:
+    """
+    Raw JSON reply for `messages`, from the response cache when this exact request was seen.
+    `section_ids` (batch requests) must all come back for the reply to be cached.
+    """
+    key = _response_key(model, temperature, messages)
+    raw = _cache_get(key)
+    if raw is None:
+        resp = client.chat.completions.create(
+            model=model,
+            temperature=temperature,
+            response_format={"type": "json_object"},
+            messages=messages,
+        )
+        raw = resp.choices[0].message.content
+        _cache_put(key, raw, section_ids)
+    return raw or "{}"
+
+
+async def _complete_async(client: AsyncOpenAI, model: str, temperature: float,
+                          messages: List[Dict[str, str]], section_ids: List[str] | None = None) -> str:
+    """Async twin of `_complete`."""
+    key = _response_key(model, temperature, messages)
+    raw = _cache_get(key)
+    if raw is None:
+        resp = await client.chat.completions.create(
+            model=model,
+            temperature=temperature,
+            response_format={"type": "json_object"},
+            messages=messages,
+        )
+        raw = resp.choices[0].message.content
+        _cache_put(key, raw, section_ids)
+    return raw or "{}"
+
+
+# ---------- public: LLM grading ----------
+
+def grade_section_llm(
+    client: OpenAI,
+    model: str,
+    rubric: Dict[str, Any],
+    section_id: str,
+    section_ctx: Dict[str, Any],
+    temperature: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Grade a single section via LLM. Returns:
+      {
+        "section_id": str,
+        "rubric_title": str,
+        "total_points": float,
+        "earned_points": float,
+        "criteria": [
+            {"criterion_id","label","max","score","rationale","improvement_tip"}
+        ],
+        "overall_comment": str
+      }
+    """
+    rsec, raw_criteria, total_max, messages = _prepare_request(rubric, section_id, section_ctx)
+
+    # Call the model with JSON response enforced
+    raw = _complete(client, model, temperature, messages)
+    return _clean_response(raw, rsec, raw_criteria, total_max, section_id)
+
+
+async def grade_section_llm_async(
+    client: AsyncOpenAI,
+    model: str,
+    rubric: Dict[str, Any],
+    section_id: str,
+    section_ctx: Dict[str, Any],
+    temperature: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Async twin of `grade_section_llm` (same prompt, same return shape) so many
+    sections can be in flight at once.
+    """
+    rsec, raw_criteria, total_max, messages = _prepare_request(rubric, section_id, section_ctx)
+
+    raw = await _complete_async(client, model, temperature, messages)
+    return _clean_response(raw, rsec, raw_criteria, total_max, section_id)
+
+
+def grade_sections_batch(
+    client: OpenAI,
+    model: str,
+    rubric: Dict[str, Any],
+    items: List[tuple[str, Dict[str, Any]]],
+    temperature: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """
+    Grade several `(section_id, section_ctx)` items of one student in a single
+    request, so the instructions and schema are sent once rather than per section.
+    Returns one `grade_section_llm`-shaped dict per item, in the same order.
+    Callers should keep `len(items)` at or below `BATCH_MAX_SECTIONS`.
+    """
+    if not items:
+        return []
+    specs, messages = _prepare_batch_request(rubric, items)
+
+    raw = _complete(client, model, temperature, messages, [sec_id for sec_id, _ in items])
+    return _clean_batch_response(raw, items, specs)
+
+
+async def grade_sections_batch_async(
+    client: AsyncOpenAI,
+    model: str,
+    rubric: Dict[str, Any],
+    items: List[tuple[str, Dict[str, Any]]],
+    temperature: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """Async twin of `grade_sections_batch`."""
+    if not items:
+        return []
+    specs, messages = _prepare_batch_request(rubric, items)
+
+    raw = await _complete_async(client, model, temperature, messages, [sec_id for sec_id, _ in items])
+    return _clean_batch_response(raw, items, specs)
\ No newline at end of file
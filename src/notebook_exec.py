@@ -1,23 +1,32 @@
 # src/notebook_exec.py
-import os, io, time, sys, re, tempfile, zipfile, shutil, json
+import os, io, time, re, tempfile, zipfile, shutil, json, asyncio
+from functools import cached_property, lru_cache
+from typing import BinaryIO
 import nbformat
-from nbclient import NotebookClient
-from nbconvert import HTMLExporter
-from jupyter_client.kernelspec import KernelSpecManager, NoSuchKernel
-from ipykernel.kernelspec import install as install_ipykernel_spec
-from nbclient.exceptions import CellTimeoutError
+import orjson
 
-from .package_manager import ensure_baseline, ensure_package
+from .package_manager import _pip_install, ensure_baseline, ensure_package
 
 class ExecResult:
     def __init__(self, executed_nb, html, duration_s, errors, probe_results):
         self.executed_nb = executed_nb
-        self.html = html
+        if html is not None:
+            self.html = html
         self.duration_s = duration_s
         self.errors = errors              # list[dict]
         self.probe_results = probe_results  # dict[str, any]
 
+    @cached_property
+    def html(self) -> str:
+        # rendered on first access unless run_ipynb_bytes was asked to render up front
+        return export_html(self.executed_nb)
+
+# nbclient/nbconvert/jupyter_client/ipykernel are imported inside the functions below: only
+# pool workers execute notebooks, so the Streamlit process doesn't pay for them at startup.
+
 def _ensure_kernel(kernel_name: str = "python3"):
+    from jupyter_client.kernelspec import KernelSpecManager, NoSuchKernel
+    from ipykernel.kernelspec import install as install_ipykernel_spec
     ksm = KernelSpecManager()
     try:
         ksm.get_kernel_spec(kernel_name)
@@ -29,113 +38,386 @@ def _ensure_kernel(kernel_name: str = "python3"):
 
 _MISSING_MOD_RE = re.compile(r"No module named '([^']+)'")
 
+def _missing_module(evalue: str) -> str | None:
+    # the usual evalue is exactly "No module named 'foo'"; only odd shapes need the regex
+    _, sep, rest = evalue.partition("No module named '")
+    if sep and len(rest) > 1 and rest.endswith("'") and "'" not in rest[:-1]:
+        return rest[:-1]
+    m = _MISSING_MOD_RE.search(evalue)
+    return m.group(1) if m else None
+
+@lru_cache(maxsize=1024)
+def _check_probe(expr: str) -> str:
+    # Parsed once per distinct expression (the same rubric probes every notebook), so a
+    # malformed probe fails here instead of as an {'__error__'} inside each kernel run
+    compile(expr, "<probe>", "eval")
+    return expr
+
+_PROBE_MARKER = "__GRADER_PROBES_JSON__"
+
+# orjson when the kernel has it (numpy values serialize natively); str() for the rest
+_PROBE_CODE = """\
+try:
+    import orjson as _J
+    _dumps = lambda o: _J.dumps(o, default=str, option=_J.OPT_SERIALIZE_NUMPY | _J.OPT_NON_STR_KEYS).decode()
+except ImportError:
+    import json as _J
+    _dumps = lambda o: _J.dumps(o, default=str)
+def _safe_eval(expr):
+    try:
+        return eval(expr, globals(), locals())
+    except Exception as e:
+        return {{'__error__': str(e)}}
+_probes = {probes_json}
+_out = {{}}
+for k, expr in _probes.items():
+    _out[k] = _safe_eval(expr)
+print({marker!r} + _dumps(_out))"""
+
 def _append_probe_cell(nb: nbformat.NotebookNode, probes: dict) -> tuple[nbformat.NotebookNode, str]:
     """
     Append a cell that evaluates each probe expression safely and prints a JSON blob.
-    `probes` is dict: {probe_id: python_expr}
-    """
-    marker = "__GRADER_PROBES_JSON__"
-    code_lines = [
-        "import json",
-        "def _safe_eval(expr):",
-        "    try:",
-        "        return eval(expr, globals(), locals())",
-        "    except Exception as e:",
-        "        return {'__error__': str(e)}",
-        f"_probes = {json.dumps(probes)}",
-        "_out = {}",
-        "for k, expr in _probes.items():",
-        "    _out[k] = _safe_eval(expr)",
-        f"print('{marker}' + json.dumps(_out))"
-    ]
-    cell = nbformat.v4.new_code_cell(source="\n".join(code_lines))
-    nb.cells.append(cell)
-    return nb, marker
+    `probes` is dict: {probe_id: python_expr}; raises SyntaxError for a malformed expr.
+    """
+    probes = {k: _check_probe(expr) for k, expr in probes.items()}
+    source = _PROBE_CODE.format(probes_json=json.dumps(probes), marker=_PROBE_MARKER)
+    nb.cells.append(nbformat.v4.new_code_cell(source=source))
+    return nb, _PROBE_MARKER
 
-def _run_once(nb, workdir: str, timeout_per_cell: int, kernel_name: str):
+# No kernel ever runs two submissions: %reset clears the user namespace but not process
+# state (os.environ, sys.path, patched modules such as np.mean = ...), so a kernel one
+# student ran could change the next student's results. To keep start-up off the critical
+# path, each process keeps one unused kernel per kernel name starting in the background
+# while the current notebook runs; a kernel is only reused for its own submission's retries.
+_SPARES: dict = {}  # kernel_name -> asyncio.Task resolving to a started, never-used client
+_kernels_finalizer = None
+_RUN_PREFIX = os.path.join(tempfile.gettempdir(), "grader_run_")
+# A reset takes milliseconds; one that hasn't replied by then means an interrupt didn't land
+_RESET_TIMEOUT = 15
+
+# Runs silently before a retry of the same submission: fresh namespace, cwd in the workdir,
+# no modules imported from the workdir, no leftover figures, counter back at 1.
+_RESET_CODE = """\
+import os as _os
+_os.chdir({workdir!r})  # first: %reset needs a valid cwd
+%reset -f
+import os as _os, sys as _sys, importlib as _il
+for _m in [_k for _k, _v in list(_sys.modules.items()) if (getattr(_v, "__file__", None) or "").startswith({prefix!r})]:
+    del _sys.modules[_m]
+_il.invalidate_caches()
+try:
+    import matplotlib.pyplot as _plt
+    _plt.close("all")
+except Exception:
+    pass
+%matplotlib inline
+get_ipython().execution_count = 1
+del _os, _sys, _il
+"""
+
+# A spare kernel starts before its workdir exists; this moves it there, touching nothing else
+_CHDIR_CODE = "import os as _os; _os.chdir({workdir!r}); del _os"
+
+async def _async_discard(client):
+    """Stop the client's channels and kill its kernel (jupyter_client's public API only)."""
+    km, kc = client.km, client.kc
+    client.km = client.kc = None
+    try:
+        if kc is not None:
+            kc.stop_channels()
+        if km is not None and km.has_kernel:
+            await km.shutdown_kernel(now=True)  # also removes the connection file
+    except Exception:
+        pass
+
+def _discard(client):
+    if client is None or client.km is None:
+        return
+    try:
+        _run_sync(_async_discard(client))
+    except Exception:
+        pass
+
+def _shutdown_kernels():
+    while _SPARES:
+        _, task = _SPARES.popitem()
+        try:
+            _discard(task.result() if task.done() else _run_sync(task))
+        except BaseException:
+            pass
+
+async def _start_client(kernel_name: str, cwd: str):
+    global _kernels_finalizer
+    from nbclient import NotebookClient
+    if _kernels_finalizer is None:
+        # pool workers exit through multiprocessing's finalizers, not atexit
+        from multiprocessing.util import Finalize
+        _kernels_finalizer = Finalize(None, _shutdown_kernels, exitpriority=10)
     client = NotebookClient(
-        nb,
-        timeout=timeout_per_cell,
+        nbformat.v4.new_notebook(),
         kernel_name=kernel_name,
         allow_errors=True,
-        resources={"metadata": {"path": workdir}},
+        shutdown_kernel="immediate",  # each kernel is thrown away after one submission
+        resources={"metadata": {"path": cwd}},
     )
+    client.km = client.create_kernel_manager()
+    try:
+        await client.async_start_new_kernel()
+        await client.async_start_new_kernel_client()
+    except BaseException:
+        await _async_discard(client)
+        raise
+    return client
+
+async def _run_silent(client, code: str) -> bool:
+    """Run `code` silently in the client's kernel; True if it replied ok within _RESET_TIMEOUT."""
+    try:
+        if not client.km.has_kernel:
+            return False
+        client.timeout = _RESET_TIMEOUT
+        msg_id = client.kc.execute(code, silent=True, store_history=False)
+        reply = await client.async_wait_for_reply(msg_id)
+        return bool(reply) and reply["content"].get("status") == "ok"
+    except Exception:
+        return False
+
+async def _acquire_client(nb, workdir: str, timeout_per_cell: int, kernel_name: str, fresh: bool = False):
+    """
+    Return a NotebookClient for `nb` on a kernel no other submission has used: the spare
+    (unless `fresh`, e.g. after a pip install), else a newly started one. Either way the
+    next spare starts in the background.
+    """
+    client = None
+    task = _SPARES.pop(kernel_name, None)
+    if task is not None:
+        try:
+            client = await task
+        except Exception:
+            client = None
+        if client is not None and (fresh or not await _run_silent(client, _CHDIR_CODE.format(workdir=workdir))):
+            await _async_discard(client)
+            client = None
+    if client is None:
+        client = await _start_client(kernel_name, workdir)
+    _SPARES[kernel_name] = asyncio.ensure_future(_start_client(kernel_name, tempfile.gettempdir()))
+    client.nb = nb
+    client.timeout = timeout_per_cell
+    return client
+
+async def _retry_client(client, nb, workdir: str, timeout_per_cell: int, kernel_name: str):
+    """For a retry of the same submission: its own kernel after a reset, else a new one."""
+    if client is not None and client.km is not None:
+        if await _run_silent(client, _RESET_CODE.format(workdir=workdir, prefix=_RUN_PREFIX)):
+            client.nb = nb
+            client.timeout = timeout_per_cell
+            return client
+        await _async_discard(client)
+    return await _acquire_client(nb, workdir, timeout_per_cell, kernel_name)
+
+async def _acquire_during(prepare, nb, workdir: str, timeout_per_cell: int, kernel_name: str):
+    """Run blocking `prepare()` (workdir set-up) in a thread while the kernel is readied."""
+    prep = asyncio.get_running_loop().run_in_executor(None, prepare)
+    try:
+        client = await _acquire_client(nb, workdir, timeout_per_cell, kernel_name)
+    except BaseException:
+        await asyncio.wait([prep])  # don't leave it writing into a workdir about to be removed
+        raise
+    try:
+        await prep
+    except BaseException:
+        await _async_discard(client)
+        raise
+    return client
+
+def _run_sync(coro):
+    # the same per-thread loop nbclient's blocking calls use, so warm kernels stay usable
+    from jupyter_core.utils import ensure_event_loop
+    return ensure_event_loop().run_until_complete(coro)
+
+@lru_cache(maxsize=1)
+def _html_exporter():
+    # one per process: the exporter compiles its Jinja template on first use and keeps it
+    from nbconvert import HTMLExporter
+    return HTMLExporter()
+
+def export_html(executed_nb) -> str:
+    """Render an executed notebook to standalone HTML."""
+    return _html_exporter().from_notebook_node(executed_nb)[0]
+
+def _run_once(client):
+    """Execute `client.nb` on the client's kernel; the caller owns (and discards) the kernel."""
+    from nbclient.exceptions import CellTimeoutError
     t0 = time.time()
-    executed = client.execute()
+    try:
+        # cleanup_kc=False keeps the kernel up for this submission's retries
+        executed = client.execute(cleanup_kc=False)
+    except CellTimeoutError:
+        # interrupt the stuck cell so the retry can reset this kernel instead of starting one
+        try:
+            _run_sync(client.km.interrupt_kernel())
+        except Exception:
+            _discard(client)
+        raise
+    except BaseException:
+        _discard(client)  # died or broke mid-run
+        raise
     dur = time.time() - t0
 
-    errs = []
-    for cell in executed.get("cells", []):
-        for out in cell.get("outputs", []) or []:
-            if out.get("output_type") == "error":
-                errs.append({
-                    "ename": out.get("ename"),
-                    "evalue": out.get("evalue"),
-                    "traceback": out.get("traceback", []),
-                })
-    html, _ = HTMLExporter().from_notebook_node(executed)
-    return executed, html, dur, errs
+    # one flat pass; cells without outputs (markdown, silent code) contribute an empty tuple
+    errs = [
+        {"ename": out.get("ename"), "evalue": out.get("evalue"), "traceback": out.get("traceback", [])}
+        for cell in executed.get("cells", ())
+        for out in cell.get("outputs") or ()
+        if out.get("output_type") == "error"
+    ]
+    return executed, dur, errs
 
 def _extract_probe_json(executed_nb, marker: str) -> dict:
-    payload = {}
-    for cell in executed_nb.get("cells", []):
-        for out in cell.get("outputs", []) or []:
-            text = None
-            if out.get("output_type") == "stream":
-                text = out.get("text", "")
-            elif out.get("output_type") == "display_data":
-                text = out.get("data", {}).get("text/plain", "")
-            if not text:
-                continue
-            if isinstance(text, list):  # sometimes list of lines
-                text = "".join(text)
-            if marker in str(text):
-                blob = str(text).split(marker, 1)[1].strip()
-                try:
-                    payload = json.loads(blob)
-                except Exception:
-                    pass
-    return payload
-
-def _strip_tagged_cells(nb, skip_tags: list[str] | None):
-    """Return a shallow-copied notebook without cells that have any of skip_tags."""
-    if not skip_tags:
-        return nb
-    skip = set(t.strip().lower() for t in skip_tags if t.strip())
-    new_nb = nbformat.from_dict(nb)
-    filtered = []
-    for c in new_nb.get("cells", []):
-        tags = set([t.lower() for t in c.get("metadata", {}).get("tags", [])])
-        if tags.intersection(skip):
+    # the probe cell is the one _append_probe_cell added last; earlier cells can't hold it
+    cells = executed_nb.get("cells")
+    if not cells:
+        return {}
+    for out in cells[-1].get("outputs") or ():
+        if out.get("output_type") == "stream":
+            text = out.get("text", "")
+        elif out.get("output_type") == "display_data":
+            text = out.get("data", {}).get("text/plain", "")
+        else:
+            continue
+        if isinstance(text, list):  # sometimes list of lines
+            text = "".join(text)
+        i = text.find(marker) if text else -1
+        if i >= 0:
+            blob = text[i + len(marker):].strip()  # slice past the marker; no copy of what precedes it
+            try:
+                return orjson.loads(blob)
+            except orjson.JSONDecodeError:
+                pass
+            try:
+                return json.loads(blob)  # the kernel's json fallback may emit NaN/Infinity
+            except Exception:
+                pass
+    return {}
+
+def _run_copy(nb, skip_tags: list[str] | None):
+    """
+    Copy of `nb` safe to execute, without the cells tagged with any of skip_tags.
+    Only what nbclient writes to is copied: the notebook metadata dict (language_info) and,
+    for code cells, the cell and its metadata dict (execution timestamps; `outputs` and
+    `execution_count` are reassigned, not mutated). Sources and existing outputs are shared.
+    """
+    skip = set(t.strip().lower() for t in skip_tags or () if t.strip())
+    cells = []
+    for c in nb.cells:
+        meta = c.get("metadata", {})
+        if skip and skip.intersection(t.lower() for t in meta.get("tags", ())):
             continue
-        filtered.append(c)
-    new_nb["cells"] = filtered
-    return new_nb
+        if c.get("cell_type") == "code":
+            c = nbformat.NotebookNode(c, metadata=nbformat.NotebookNode(meta))
+        cells.append(c)
+    return nbformat.NotebookNode(nb, metadata=nbformat.NotebookNode(nb.metadata), cells=cells)
+
+def _runnable(base_nb, skip_tags: list[str] | None, probes: dict | None):
+    """
+    Fresh copy of the parsed notebook for one attempt (tagged cells dropped, probe cell
+    appended). Execution writes outputs into cells in place, so retries copy the pristine
+    parse instead of re-reading the notebook JSON.
+    """
+    nb = _run_copy(base_nb, skip_tags)
+    marker = None
+    if probes:
+        nb, marker = _append_probe_cell(nb, probes)
+    return nb, marker
+
+def _is_zip_junk(name: str) -> bool:
+    # resource forks and Finder metadata that macOS "Compress" adds to every archive
+    return name.startswith("__MACOSX/") or name.rsplit("/", 1)[-1] == ".DS_Store"
+
+def _extract_zip(src, dest: str):
+    with zipfile.ZipFile(src) as z:
+        # extract() keeps extractall's path sanitizing; Finder's metadata is skipped
+        for zi in z.infolist():
+            if not _is_zip_junk(zi.filename):
+                z.extract(zi, dest)
+
+# The app shares one data ZIP path across a Run's jobs: each worker inflates it once and
+# copies the tree per notebook (copying is far cheaper than re-inflating). Only the latest
+# ZIP is kept; a new path, size or mtime replaces it.
+_DATA_DIR: dict = {}  # (path, size, mtime_ns) -> extracted dir
+_data_finalizer = None
+
+def _drop_extracted_data():
+    while _DATA_DIR:
+        shutil.rmtree(_DATA_DIR.popitem()[1], ignore_errors=True)
+
+def _extracted_data(zip_path: str) -> str:
+    global _data_finalizer
+    st = os.stat(zip_path)
+    key = (zip_path, st.st_size, st.st_mtime_ns)
+    d = _DATA_DIR.get(key)
+    if d is not None and os.path.isdir(d):
+        return d
+    _drop_extracted_data()
+    if _data_finalizer is None:
+        from multiprocessing.util import Finalize
+        _data_finalizer = Finalize(None, _drop_extracted_data, exitpriority=10)
+    d = tempfile.mkdtemp(prefix="grader_data_")
+    try:
+        _extract_zip(zip_path, d)
+    except BaseException:
+        shutil.rmtree(d, ignore_errors=True)
+        raise
+    _DATA_DIR[key] = d
+    return d
+
+def _parse_nb(src) -> nbformat.NotebookNode:
+    """
+    Parse notebook JSON from bytes, any buffer (memoryview/bytearray, parsed in place
+    without a bytes copy) or a binary file-like (e.g. a spooled temp file).
+    v4 notebooks skip nbformat.reads' schema validation, which only logs and costs more
+    than the parse on output-heavy notebooks; older formats go through the converter.
+    """
+    if hasattr(src, "read"):
+        src.seek(0)
+        src = src.read()
+    raw = orjson.loads(src)
+    if isinstance(raw, dict) and raw.get("nbformat") == 4:
+        return nbformat.v4.to_notebook_json(raw)
+    return nbformat.reads(str(src, "utf-8"), as_version=4)
 
 def run_ipynb_bytes(
-    ipynb_bytes: bytes,
+    ipynb_bytes: bytes | memoryview | BinaryIO,
     timeout_per_cell: int = 90,
-    data_zip: bytes | None = None,
+    data_zip: bytes | str | None = None,
     extra_requirements_txt: bytes | None = None,
     probes: dict | None = None,
     retry_on_timeout: bool = True,
     skip_tags: list[str] | None = None,
+    render_html: bool = False,
 ) -> ExecResult:
     """
-    Execute a notebook with:
+    Execute a notebook (bytes, a memoryview, or a binary file-like) with:
     - baseline libs ensured
     - optional requirements.txt (pip install)
-    - optional data.zip extracted to working dir (so relative file paths resolve)
+    - optional data.zip (bytes, or a path to share one file across jobs; a path is inflated
+      once per process) extracted to the working dir so relative file paths resolve
     - optional `probes` dict of {probe_id: python_expr}; evaluated inside the kernel
     - optional skip_tags: drop cells tagged with any of these (e.g., ["skip_autograde","long"])
     - one retry if CellTimeoutError occurs (2x timeout)
+    - render_html=False defers the HTML export until ExecResult.html is first read
     """
+    from nbclient.exceptions import CellTimeoutError
+
     workdir = tempfile.mkdtemp(prefix="grader_run_")
-    try:
+    client = None
+
+    def prepare():
         # Make referenced files available (data ZIP)
-        if data_zip:
-            with zipfile.ZipFile(io.BytesIO(data_zip)) as z:
-                z.extractall(workdir)
+        if isinstance(data_zip, str):
+            # a plain copy of this worker's extraction, so writes stay private to the student
+            shutil.copytree(_extracted_data(data_zip), workdir, dirs_exist_ok=True)
+        elif data_zip:
+            _extract_zip(io.BytesIO(data_zip), workdir)
 
         # Optional requirements.txt (best-effort)
         if extra_requirements_txt:
@@ -143,32 +425,39 @@ def run_ipynb_bytes(
             with open(req_path, "wb") as f:
                 f.write(extra_requirements_txt)
             try:
-                import subprocess
-                subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", req_path])
+                _pip_install("-r", req_path)
             except Exception:
                 pass
 
         # Ensure a reasonable set of default libs
         ensure_baseline()
 
+    try:
         # Load base notebook + kernel
-        base_nb = nbformat.reads(ipynb_bytes.decode("utf-8"), as_version=4)
+        base_nb = _parse_nb(ipynb_bytes)
         kernel_name = getattr(getattr(base_nb, "metadata", {}), "kernelspec", {}).get("name", None) or "python3"
         kernel_name = _ensure_kernel(kernel_name)
 
         # Build runnable copy with optional filtering and probes
-        marker = None
-        nb_to_run = _strip_tagged_cells(base_nb, skip_tags)
-        if probes:
-            nb_to_run, marker = _append_probe_cell(nb_to_run, probes)
+        nb_to_run, marker = _runnable(base_nb, skip_tags, probes)
+
+        if extra_requirements_txt:
+            # installs may replace packages the spare already imported: install, then start fresh
+            prepare()
+            client = _run_sync(_acquire_client(nb_to_run, workdir, timeout_per_cell, kernel_name, fresh=True))
+        else:
+            # kernel hand-over overlaps the ZIP extraction and baseline check
+            client = _run_sync(_acquire_during(prepare, nb_to_run, workdir, timeout_per_cell, kernel_name))
 
         # First run
         try:
-            executed, html, dur, errs = _run_once(nb_to_run, workdir, timeout_per_cell, kernel_name)
+            executed, dur, errs = _run_once(client)
         except CellTimeoutError:
             if retry_on_timeout:
                 # Retry once with doubled per-cell timeout
-                executed, html, dur, errs = _run_once(nb_to_run, workdir, timeout_per_cell * 2, kernel_name)
+                nb_to_run, marker = _runnable(base_nb, skip_tags, probes)
+                client = _run_sync(_retry_client(client, nb_to_run, workdir, timeout_per_cell * 2, kernel_name))
+                executed, dur, errs = _run_once(client)
                 errs = errs + [{"ename": "CellTimeoutError", "evalue": f"Retried with {timeout_per_cell*2}s per-cell timeout", "traceback": []}]
             else:
                 raise
@@ -177,24 +466,67 @@ def run_ipynb_bytes(
         missing = None
         for e in errs:
             if e.get("ename") == "ModuleNotFoundError" and e.get("evalue"):
-                m = _MISSING_MOD_RE.search(e["evalue"])
-                if m:
-                    missing = m.group(1)
+                missing = _missing_module(e["evalue"])
+                if missing:
                     break
         if missing:
             try:
                 ensure_package(missing)
-                nb_to_run = _strip_tagged_cells(base_nb, skip_tags)
-                if probes:
-                    nb_to_run, marker = _append_probe_cell(nb_to_run, probes)
-                executed, html, dur, errs = _run_once(nb_to_run, workdir, timeout_per_cell, kernel_name)
+                nb_to_run, marker = _runnable(base_nb, skip_tags, probes)
+                # the install may have replaced modules this kernel already imported: start fresh
+                _discard(client)
+                client = None
+                client = _run_sync(_acquire_client(nb_to_run, workdir, timeout_per_cell, kernel_name, fresh=True))
+                executed, dur, errs = _run_once(client)
             except Exception:
                 pass
 
         probe_results = _extract_probe_json(executed, marker) if marker else {}
+        # rendered once, for the run that's kept (not for a timed-out or pre-install attempt)
+        html = export_html(executed) if render_html else None
         return ExecResult(executed, html, dur, errs, probe_results)
     finally:
+        _discard(client)  # never handed to another submission
         try:
             shutil.rmtree(workdir)
         except Exception:
-            pass
\ No newline at end of file
+            pass
+
+def warm_worker():
+    """
+    Process-pool initializer: run the baseline package check and the nbclient import once
+    per worker at start-up, instead of inside the first notebook's run.
+    """
+    ensure_baseline()
+    import nbclient  # noqa: F401
+
+def run_ipynb_job(
+    ipynb_bytes: bytes,
+    timeout_per_cell: int = 90,
+    data_zip: bytes | str | None = None,
+    extra_requirements_txt: bytes | None = None,
+    retry_on_timeout: bool = True,
+    skip_tags: list[str] | None = None,
+    render_html: bool = False,
+) -> dict:
+    """
+    Process-pool entry point: run one notebook and return a plain, picklable dict
+    (executed_nb, html, duration_s, errors) instead of an ExecResult; html is None unless
+    render_html is set (export_html renders it later, when it's actually viewed).
+    """
+    res = run_ipynb_bytes(
+        ipynb_bytes,
+        timeout_per_cell=timeout_per_cell,
+        data_zip=data_zip,
+        extra_requirements_txt=extra_requirements_txt,
+        probes=None,
+        retry_on_timeout=retry_on_timeout,
+        skip_tags=skip_tags,
+        render_html=render_html,
+    )
+    return {
+        "executed_nb": res.executed_nb,
+        "html": res.html if render_html else None,
+        "duration_s": res.duration_s,
+        "errors": res.errors,
+    }
\ No newline at end of file
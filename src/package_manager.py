@@ -1,6 +1,7 @@
 # src/package_manager.py
-import sys, subprocess, importlib
+import os, sys, subprocess, importlib, importlib.metadata, importlib.util
 from functools import lru_cache
+from packaging.requirements import Requirement
 
 BASELINE = [
     "numpy>=1.26",
@@ -12,8 +13,34 @@ BASELINE = [
     # add more common student libs here if needed
 ]
 
-def _pip_install(package: str):
-    subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+_PIP_ENV = {"PIP_NO_COLOR": "1", "PIP_ROOT_USER_ACTION": "ignore"}
+
+def _pip_install(*packages: str):
+    # quiet, no progress bar on the pipe; stderr is kept on the CalledProcessError if it fails
+    subprocess.run(
+        [sys.executable, "-m", "pip", "install", "--no-input", "--disable-pip-version-check",
+         "--quiet", "--prefer-binary", *packages],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env={**os.environ, **_PIP_ENV}, check=True,
+    )
+
+def _satisfied(spec: str) -> bool:
+    """Whether the installed distribution meets `spec` (e.g. 'pandas>=2.2'), read from metadata."""
+    req = Requirement(spec)
+    try:
+        return req.specifier.contains(importlib.metadata.version(req.name), prereleases=True)
+    except importlib.metadata.PackageNotFoundError:
+        return False
+
+def installed_versions() -> tuple:
+    """Python and baseline package versions, for keying results that depend on them."""
+    out = [("python", sys.version.split()[0])]
+    for spec in BASELINE:
+        name = Requirement(spec).name
+        try:
+            out.append((name, importlib.metadata.version(name)))
+        except importlib.metadata.PackageNotFoundError:
+            out.append((name, None))
+    return tuple(out)
 
 @lru_cache(maxsize=None)
 def ensure_package(mod_or_spec: str, pip_spec: str | None = None) -> bool:
@@ -21,6 +48,10 @@ def ensure_package(mod_or_spec: str, pip_spec: str | None = None) -> bool:
     Try to import a module; if missing, pip install then import again.
     Returns True if import succeeds.
     """
+    # Student code imports it in the kernel, not here: locating it is enough, and importing
+    # e.g. sklearn into every worker just to prove it's installed costs a second or more
+    if "." not in mod_or_spec and importlib.util.find_spec(mod_or_spec) is not None:
+        return True
     try:
         importlib.import_module(mod_or_spec)
         return True
@@ -30,13 +61,29 @@ def ensure_package(mod_or_spec: str, pip_spec: str | None = None) -> bool:
         importlib.import_module(mod_or_spec)
         return True
 
+_baseline_verified = False
+
 def ensure_baseline():
-    for spec in BASELINE:
-        # If given as 'pkg>=ver' use the left part for import when possible
-        pip_spec = spec
-        mod = spec.split(">=")[0].split("==")[0].strip()
+    global _baseline_verified
+    if _baseline_verified:
+        return
+    # The installed version is read from package metadata; importing pandas/statsmodels
+    # here just to prove they exist would cost seconds in every worker
+    missing = [spec for spec in BASELINE if not _satisfied(spec)]
+    if missing:
         try:
-            ensure_package(mod, pip_spec)
+            # one resolver run for everything missing, not one pip start-up per package
+            _pip_install(*missing)
         except Exception:
-            # don't fail the whole run if a baseline extra fails; continue
-            pass
\ No newline at end of file
+            # one bad spec fails the whole batch: retry individually so the rest still land
+            for spec in missing:
+                try:
+                    _pip_install(spec)
+                except Exception:
+                    # don't fail the whole run if a baseline extra fails; continue
+                    pass
+        importlib.invalidate_caches()
+        # a failed install is tried again on the next run rather than never in this worker
+        if not all(_satisfied(spec) for spec in missing):
+            return
+    _baseline_verified = True
\ No newline at end of file
@@ -1,7 +1,37 @@
 """
 Render student-facing reports (HTML/Markdown).
-Step 4 will implement:
-- Jinja2 HTML rendering from a template
-- optional Markdown export
+- Jinja2 HTML rendering from templates/report.html.j2
+- optional Markdown export (not yet)
 """
-# TODO: implement in Step 4
\ No newline at end of file
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict
+
+import jinja2
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+
+
+@lru_cache(maxsize=None)
+def _template(name: str) -> jinja2.Template:
+    # compiled once per process; templates ship with the app, so no reload checks
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        auto_reload=False,
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    return env.get_template(name)
+
+
+def render_student_report(sid: str, res: Dict[str, Any], sec_overrides: Dict[str, float]) -> str:
+    """HTML report for one graded student; `sec_overrides` maps section_id -> manual score."""
+    sections = [(sec, float(sec_overrides.get(sec["section_id"], sec["earned_points"]))) for sec in res["sections"]]
+    return _template("report.html.j2").render(
+        sid=sid,
+        res=res,
+        sections=sections,
+        total_override=sum(score for _, score in sections),
+    )
\ No newline at end of file
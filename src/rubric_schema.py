@@ -1,7 +1,13 @@
 # src/rubric_schema.py
-import json
+import orjson
 import pandas as pd
 
+try:
+    import python_calamine  # noqa: F401  (enables pandas' Rust-backed "calamine" engine)
+    _EXCEL_ENGINE = "calamine"
+except ImportError:  # optional; pandas falls back to openpyxl
+    _EXCEL_ENGINE = None
+
 # Legacy deterministic types still accepted (you may ignore them in LLM-only mode)
 _ALLOWED_TYPES = {
     "columns","row_count","stat_range","unique_count",
@@ -9,76 +15,81 @@ _ALLOWED_TYPES = {
     "llm_feedback","llm_grade"
 }
 
-_ALIASES_TO_LLM_GRADE = {"llm_grader","llm","llmgrade","freeform","feedback"}
+# llm_feedback is folded in too, so downstream only handles llm_grade
+_ALIASES_TO_LLM_GRADE = frozenset({"llm_grader","llm","llmgrade","freeform","feedback","llm_feedback"})
 
 def _normalize_type(t: str) -> str:
     if not t:
         return "llm_grade"
-    t = str(t).strip().lower()
-    if t in _ALIASES_TO_LLM_GRADE:
-        return "llm_grade"
-    if t == "llm_feedback":
-        # unify to llm_grade so downstream only handles one
-        return "llm_grade"
-    return t
+    t = (t if isinstance(t, str) else str(t)).strip().lower()
+    return "llm_grade" if t in _ALIASES_TO_LLM_GRADE else t
+
+_ALLOWED_TYPES_MSG = f"Allowed: {sorted(_ALLOWED_TYPES)}"
 
-def _normalize_inplace(rubric: dict):
-    for s in rubric.get("sections", []):
-        for c in s.get("criteria", []):
-            c["type"] = _normalize_type(c.get("type",""))
+def effective_points(section: dict) -> float:
+    """Section points if set, else the sum of its criteria maxima."""
+    return float(section.get("points") or sum(c.get("max",0) for c in section.get("criteria",[])))
 
-def _validate(rubric: dict):
-    assert "sections" in rubric and isinstance(rubric["sections"], list), "Rubric missing `sections`"
+def _prepare_inplace(rubric: dict, types_normalized: bool = False):
+    """
+    Normalize criterion types and validate in one walk; `types_normalized` skips
+    re-normalizing types the caller already mapped.
+    """
+    if not isinstance(rubric.get("sections"), list):
+        raise ValueError("Rubric missing `sections`")
     for s in rubric["sections"]:
-        assert "id" in s and "criteria" in s, f"Section invalid: {s}"
+        if "id" not in s or "criteria" not in s:
+            raise ValueError(f"Section invalid: {s}")
         for c in s["criteria"]:
-            ctype = c.get("type","")
+            if not types_normalized:
+                c["type"] = _normalize_type(c.get("type",""))
+            ctype = c["type"]
             if ctype not in _ALLOWED_TYPES:
-                raise ValueError(
-                    f"Criterion type '{ctype}' not supported. Allowed: {sorted(_ALLOWED_TYPES)}"
-                )
+                raise ValueError(f"Criterion type '{ctype}' not supported. {_ALLOWED_TYPES_MSG}")
 
 def load_rubric_json(file) -> dict:
-    data = json.load(file)
-    _normalize_inplace(data)
-    _validate(data)
+    data = orjson.loads(file.read())
+    _prepare_inplace(data)
     return data
 
+def _parse_args(raw) -> dict:
+    # args_json cells are optional; bad JSON degrades to no args
+    if isinstance(raw, str) and raw.strip():
+        try:
+            return orjson.loads(raw)
+        except Exception:
+            return {}
+    return {}
+
+def _col(df: pd.DataFrame, name: str, default) -> pd.Series:
+    return df[name] if name in df else pd.Series(default, index=df.index, dtype=object)
+
+def _id_str(ids: pd.Series) -> pd.Series:
+    # a blank cell turns an integer id column into floats; keep 1.0 matching "1"
+    if ids.dtype.kind == "f":
+        return ids.map(lambda v: str(int(v)) if v.is_integer() else str(v), na_action="ignore")
+    return ids.astype(str).where(ids.notna())
+
 def load_rubric_excel(file) -> dict:
-    xls = pd.ExcelFile(file)
-    sections = pd.read_excel(xls, "Sections")
+    xls = pd.ExcelFile(file, engine=_EXCEL_ENGINE)
+    sections = pd.read_excel(xls, "Sections").sort_values("order")
     criteria = pd.read_excel(xls, "Criteria")
-    out = {"sections": []}
-    by_sec = criteria.groupby("section_id")
 
-    for _, srow in sections.sort_values("order").iterrows():
-        sid = str(srow["section_id"])
-        sec = {
-            "id": sid,
-            "title": srow.get("title",""),
-            "points": float(srow.get("points", 0) or 0),
-            "criteria": []
-        }
-        if sid in by_sec.groups:
-            for _, crow in by_sec.get_group(sid).iterrows():
-                # parse args_json (optional)
-                args = {}
-                raw = crow.get("args_json", "")
-                if isinstance(raw, str) and raw.strip():
-                    try:
-                        args = json.loads(raw)
-                    except Exception:
-                        args = {}
-                ctype = _normalize_type(crow.get("type",""))
-                sec["criteria"].append({
-                    "id": str(crow["criterion_id"]),
-                    "criterion": crow.get("label",""),
-                    "type": ctype,
-                    "args": args,
-                    "max": float(crow.get("max_points", 0) or 0),
-                })
-        out["sections"].append(sec)
+    # Coerce/parse whole columns once, then group; no per-row Series
+    crit = pd.DataFrame({
+        "id": criteria["criterion_id"].astype(str),
+        "criterion": _col(criteria, "label", ""),
+        "type": _col(criteria, "type", "").map(_normalize_type),
+        "args": _col(criteria, "args_json", "").map(_parse_args),
+        "max": pd.to_numeric(_col(criteria, "max_points", 0), errors="coerce").fillna(0.0).astype(float),
+    })
+    by_sec = {sid: sub.to_dict(orient="records") for sid, sub in crit.groupby(_id_str(criteria["section_id"]), sort=False)}
+
+    points = pd.to_numeric(_col(sections, "points", 0), errors="coerce").fillna(0.0)
+    out = {"sections": [
+        {"id": sid, "title": title, "points": float(pts), "criteria": list(by_sec.get(sid, []))}
+        for sid, title, pts in zip(_id_str(sections["section_id"]), _col(sections, "title", ""), points)
+    ]}
 
-    _normalize_inplace(out)
-    _validate(out)
+    _prepare_inplace(out, types_normalized=True)  # the "type" column was mapped above
     return out
\ No newline at end of file
@@ -2,24 +2,32 @@ def split_sections(nb, rubric=None):
     """
     Split a notebook into sections by looking for rubric section IDs in markdown cells.
     Falls back to Q1/Q2 detection if rubric is not provided.
+    Returns {section_id: [cell index, ...]}; indices rather than cells, so the spans stay
+    small in session state while the executed notebook itself lives on disk.
     """
     spans = {}
     current = None
+    # hoisted out of the cell loop: the id list is the same for every markdown cell
+    sec_ids = [sec["id"] for sec in rubric["sections"]] if rubric else None
 
-    for cell in nb["cells"]:
+    for idx, cell in enumerate(nb["cells"]):
         if cell["cell_type"] == "markdown":
-            txt = "".join(cell.get("source", []))
-            if rubric:
+            src = cell.get("source", "")
+            # nbformat v4 reads source as one str; joining that would copy it char by char
+            txt = src if isinstance(src, str) else "".join(src)
+            if sec_ids is not None:
                 # Look for exact rubric section IDs
-                for sec in rubric["sections"]:
-                    if sec["id"] in txt:
-                        current = sec["id"]
+                for sec_id in sec_ids:
+                    if sec_id in txt:
+                        current = sec_id
                         spans[current] = []
             else:
                 # Fallback heuristic (Q1, Q2, etc.)
-                if txt.strip().startswith("Q"):
-                    current = txt.strip().split()[0]
+                # only the first token matters: don't strip or split the whole cell for it
+                head = txt.lstrip()
+                if head.startswith("Q"):
+                    current = head.split(None, 1)[0]
                     spans[current] = []
         if current:
-            spans[current].append(cell)
-    return spans
\ No newline at end of file
+            spans[current].append(idx)
+    return spans
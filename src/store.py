@@ -0,0 +1,102 @@
+# src/store.py
+from __future__ import annotations
+import gzip
+import hashlib
+import os
+import shutil
+import weakref
+from typing import Any, Dict
+
+import nbformat
+import orjson
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is the fallback codec
+    zstandard = None
+
+_EXT = "zst" if zstandard else "gz"
+
+
+def _open(path: str, mode: str):
+    """Text-mode open through zstd (level 3) when available, else gzip."""
+    if zstandard is not None:
+        cctx = zstandard.ZstdCompressor(level=3) if "w" in mode else None
+        return zstandard.open(path, mode, cctx=cctx, encoding="utf-8")
+    return gzip.open(path, mode, encoding="utf-8", compresslevel=5)
+
+
+class ExecutionStore:
+    """
+    Keeps executed notebooks and their HTML renders (made on first view) on disk (zstd, or
+    gzip without `zstandard`), so session state only carries the small per-student `meta`:
+      <root>/<key>.ipynb.zst, <root>/<key>.html.zst
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.meta: Dict[str, Dict[str, Any]] = {}  # student_id -> metadata
+        # the root goes with the store (session end or close()), not with the process
+        self._finalizer = weakref.finalize(self, shutil.rmtree, root, ignore_errors=True)
+
+    def _path(self, sid: str, ext: str) -> str:
+        # student ids come from filenames; hash them rather than trust them as paths
+        key = hashlib.blake2b(sid.encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.root, f"{key}.{ext}.{_EXT}")
+
+    def put(self, sid: str, meta: Dict[str, Any], executed_nb: nbformat.NotebookNode,
+            html: str | None = None) -> Dict[str, Any]:
+        """Write the notebook (+ HTML, if rendered) for `sid` and record `meta` (plus `nb_hash`)."""
+        text = nbformat.writes(executed_nb)
+        with _open(self._path(sid, "ipynb"), "wt") as f:
+            f.write(text)
+        if html is None:
+            self._remove(sid, "html")  # an earlier run's render would be stale now
+        else:
+            self.put_html(sid, html)
+        meta = dict(meta, nb_hash=hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest())
+        self.meta[sid] = meta
+        return meta
+
+    def update(self, sid: str, **fields: Any) -> None:
+        """Change metadata only (e.g. a renamed student) without rewriting the files."""
+        self.meta[sid].update(fields)
+
+    def put_html(self, sid: str, html: str) -> None:
+        with _open(self._path(sid, "html"), "wt") as f:
+            f.write(html)
+
+    def _remove(self, sid: str, ext: str) -> None:
+        try:
+            os.remove(self._path(sid, ext))
+        except FileNotFoundError:
+            pass
+
+    def drop(self, sid: str) -> None:
+        self.meta.pop(sid, None)
+        for ext in ("ipynb", "html"):
+            self._remove(sid, ext)
+
+    def load_nb(self, sid: str) -> nbformat.NotebookNode:
+        # put() only ever writes v4, so skip nbformat.read's schema validation on every view
+        with _open(self._path(sid, "ipynb"), "rt") as f:
+            return nbformat.v4.to_notebook_json(orjson.loads(f.read()))
+
+    def load_html(self, sid: str) -> str | None:
+        """The stored render, or None if it hasn't been rendered yet."""
+        try:
+            with _open(self._path(sid, "html"), "rt") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def clear(self) -> None:
+        self.meta.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+    def close(self) -> None:
+        """Delete the store's directory now; the store is unusable afterwards."""
+        self.meta.clear()
+        self._finalizer()